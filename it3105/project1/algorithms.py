@@ -3,10 +3,11 @@
 # Created by 'myth' on 10/2/15
 
 from abc import abstractmethod
-from itertools import product
+from collections import deque
 from common import *
+from datastructures import BitDomain, CombinedView, CSPState, DomainCodec, PriorityQueue, Queue
 import abc
-import heapq
+import multiprocessing
 
 
 # --- A* ---
@@ -18,8 +19,10 @@ ASTAR_OPTIONS = [
 ]
 ASTAR_HEURISTIC = [
     'manhattan',
-    'euclidean'
+    'euclidean',
+    'landmarks'
 ]
+INFINITY = float('inf')
 
 
 class AStarProblem(metaclass=abc.ABCMeta):
@@ -47,6 +50,30 @@ class AStarProblem(metaclass=abc.ABCMeta):
     def heuristic(self, node):
         pass
 
+    def edge_cost(self, node, successor):
+        """
+        Returns the cost of moving from a node to one of its successors.
+        Defaults to the arc cost of the node being left
+        :param node: The node to move from
+        :param successor: The node to move to
+        """
+        return self.arc_cost(node)
+
+    def get_all_predecessor_nodes(self, node):
+        """
+        Returns all nodes that have the given node as a successor. Used when searching backwards from the goal.
+        Defaults to the successors, which holds for problems with symmetric moves
+        :param node: The node to find predecessors of
+        """
+        return self.get_all_successor_nodes(node)
+
+    def reverse_heuristic(self, node):
+        """
+        Estimates the cost from the start node to the given node. Used when searching backwards from the goal
+        :param node: The node to perform the heuristic function on
+        """
+        raise NotImplementedError('%s does not support backward search' % type(self).__name__)
+
 
 class AStar(object):
     """
@@ -67,7 +94,11 @@ class AStar(object):
         self.mode = mode
         self.problem = problem
 
-        self.open_set = []
+        self.open_set = {
+            'best': lambda: PriorityQueue(),  # Ascending heap queue
+            'bfs': lambda: Queue(),  # FIFO queue
+            'dfs': lambda: Queue(lifo=True)  # LIFO queue
+        }.get(self.mode)()
         self.closed_set = set()
 
         self.start_node = self.problem.get_start_node()
@@ -75,24 +106,32 @@ class AStar(object):
 
         self.path = []
         self.parent_of = {}
+        self.expanded = 0
 
-        if self.mode == 'best':
-            heapq.heapify(self.open_set)
+        # Every generated node, mapping to itself. Problems whose nodes are identified by value, like CSPNode,
+        # build a new object for a state that was already generated, so the stored node is looked up in here
+        self.generated = {self.start_node: self.start_node}
 
         log("A* initiated successfully")
 
-    def agenda_loop(self):
+    def agenda_loop(self, trace=True):
         """
         The implementation of the A* algorithm. This is the main loop for the algorithm
+        :param trace: Whether to yield a step for every expansion. If False, only the goal step is yielded,
+        which skips the path reconstruction done for every intermediate step
         """
+        self.start_node.h = self.problem.heuristic(self.start_node)
+        self.start_node.f = self.start_node.g + self.start_node.h
         self.add_node(self.start_node)
 
         while len(self.open_set):
             node = self.take_node()
             self.closed_set.add(node)
+            self.expanded += 1
 
             if node.is_goal:
                 log('Reached the goal node for this problem instance')
+                self.goal_node = node
                 yield {
                     'open_set': self.open_set,
                     'closed_set': self.closed_set,
@@ -103,58 +142,97 @@ class AStar(object):
             successors = self.problem.get_all_successor_nodes(node) or []
 
             for successor in successors:
+                successor = self.generated.setdefault(successor, successor)
                 node.children.add(successor)
                 if successor not in self.closed_set and successor not in self.open_set:
                     self.attach_and_eval(successor, node)
                     self.add_node(successor)
-                elif node.g + self.problem.arc_cost(node) < successor.g:
+                elif node.g + self.problem.edge_cost(node, successor) < successor.g:
                     self.attach_and_eval(successor, node)  # Returns f value, but is never used
-                    if successor in self.closed_set:
+                    if successor in self.open_set:
+                        self.reorder_node(successor)
+                    elif successor in self.closed_set:
                         debug('Reached closed node, propagating path')
-                        self.propagate_path(node)
+                        self.propagate_path(successor)
 
             # Yields the current open- and closed set to the function that called the agenda_loop
-            yield {
-                'open_set': self.open_set,
-                'closed_set': self.closed_set,
-                'path': self.get_path_from_node([node])
-            }
+            if trace:
+                yield {
+                    'open_set': self.open_set,
+                    'closed_set': self.closed_set,
+                    'path': self.get_path_from_node([node])
+                }
+
+    def solve(self):
+        """
+        Runs the agenda loop to completion without tracing the intermediate steps.
+        Intended for headless use where no GUI consumes the steps
+        :return: A dict with the final path (empty if no solution exists), open set, closed set and expansion count
+        """
+        for step in self.agenda_loop(trace=False):
+            self.path = step['path']
+
+        return {
+            'open_set': self.open_set,
+            'closed_set': self.closed_set,
+            'path': self.path,
+            'expanded': self.expanded
+        }
 
     def attach_and_eval(self, successor, node):
         self.parent_of[successor] = node
-        successor.g = node.g + self.problem.arc_cost(node)
+        successor.parent = node
+        successor.g = node.g + self.problem.edge_cost(node, successor)
         successor.h = self.problem.heuristic(successor)
         successor.f = successor.g + successor.h
 
     def propagate_path(self, node):
-        for child in node.children:
-            if node.g + self.problem.arc_cost(node) < child.g:
-                self.parent_of[child] = node
-                child.g = node.g + self.problem.arc_cost(node)
-                child.h = self.problem.heuristic(child)
-                child.f = child.g + child.h
-                self.propagate_path(child)
+        """
+        Pushes an improved g value from a node down to all descendants that can be reached more cheaply through it.
+        Affected nodes are processed in order of their new g value, so each is visited once with its final value.
+        The heuristic does not depend on g, so the cached h values are reused
+        :param node: The node whose g value was improved
+        """
+        pending = PriorityQueue(key=lambda n: n.g)
+        pending.push(node)
+
+        while pending:
+            current = pending.pop()
+            for child in current.children:
+                g = current.g + self.problem.edge_cost(current, child)
+                if g < child.g:
+                    self.parent_of[child] = current
+                    child.parent = current
+                    child.g = g
+                    child.f = g + child.h
+                    if child in self.open_set:
+                        self.reorder_node(child)
+                    if child in pending:
+                        pending.update(child)
+                    else:
+                        pending.push(child)
 
     def add_node(self, node):
         """
         Method to add the node to the open set depending on the mode
         :param node: The node to append to the list
         """
-        return {
-            'best': lambda: heapq.heappush(self.open_set, node),  # Insert to ascending heap queue
-            'bfs': lambda: self.open_set.append(node),  # Insert to back of queue (FIFO)
-            'dfs': lambda: self.open_set.insert(0, node)  # Insert to front of queue (LIFO)
-        }.get(self.mode)()
+        self.open_set.push(node)
+
+    def reorder_node(self, node):
+        """
+        Moves a node to its correct position in the open set after its f value has been lowered
+        Only the 'best' mode is ordered by f, so the other modes are left untouched
+        :param node: A node currently in the open set
+        """
+        if self.mode == 'best':
+            self.open_set.update(node)
 
     def take_node(self):
         """
         Method to take the right node from the open set depending on the mode
         """
-        return {
-            'best': lambda: heapq.heappop(self.open_set),  # Get first element in queue
-            'bfs': lambda: self.open_set.pop(0),
-            'dfs': lambda: self.open_set.pop(0)
-        }.get(self.mode)()
+        return self.open_set.pop()
 
     def get_path_from_node(self, path):
         """
@@ -167,10 +245,279 @@ class AStar(object):
             path.append(self.parent_of[path[-1]])
         return path[::]
 
+
+class BidirectionalAStar(AStar):
+    """
+    Bidirectional A*, running one search forward from the start node and one backward from the goal node.
+    Both directions use front-to-end heuristics, and the search stops once the best path found through a
+    meeting node costs no more than the smallest f value in either frontier.
+    The problem must have a goal node and implement reverse_heuristic.
+    :param problem: The problem to run bidirectional A* on
+    """
+
+    def __init__(self, problem=None):
+        """
+        Initializing the bidirectional A* object with the given problem
+        """
+        super(BidirectionalAStar, self).__init__(mode='best', problem=problem)
+
+        self.goal_node = self.problem.get_goal_node()
+        if self.goal_node is None:
+            raise Exception("Bidirectional A* requires a problem with a goal node")
+
+        # Search state is kept per direction, since both searches may label the same node
+        self.g = ({}, {})
+        self.h = ({}, {})
+        self.parents = ({}, {})
+        self.open_sets = (
+            PriorityQueue(key=lambda node: (self.g[0][node] + self.h[0][node], self.h[0][node])),
+            PriorityQueue(key=lambda node: (self.g[1][node] + self.h[1][node], self.h[1][node]))
+        )
+        self.closed_sets = (set(), set())
+
+        self.open_set = CombinedView(*self.open_sets)
+        self.closed_set = CombinedView(*self.closed_sets)
+
+        self.best_cost = float('inf')
+        self.meeting_node = None
+
+    def agenda_loop(self, trace=True):
+        """
+        The implementation of the bidirectional A* algorithm. Expands the direction with the smallest frontier
+        :param trace: Whether to yield a step for every expansion. If False, only the final step is yielded
+        """
+        for direction, root in enumerate((self.start_node, self.goal_node)):
+            self.g[direction][root] = 0
+            self.h[direction][root] = self.estimate(root, direction)
+            self.open_sets[direction].push(root)
+
+        if self.start_node is self.goal_node:
+            self.best_cost = 0
+            self.meeting_node = self.start_node
+
+        while self.open_sets[0] and self.open_sets[1] and not self.is_done():
+            direction = 0 if len(self.open_sets[0]) <= len(self.open_sets[1]) else 1
+            node = self.open_sets[direction].pop()
+            self.closed_sets[direction].add(node)
+            self.expanded += 1
+
+            self.expand(node, direction)
+
+            if trace:
+                yield {
+                    'open_set': self.open_set,
+                    'closed_set': self.closed_set,
+                    'path': self.get_path_from_node([node], direction)
+                }
+
+        if self.meeting_node is not None:
+            log('Search frontiers met, reached the goal node for this problem instance')
+            backward = self.get_path_from_node([self.meeting_node], 1)
+            forward = self.get_path_from_node([self.meeting_node], 0)
+            yield {
+                'open_set': self.open_set,
+                'closed_set': self.closed_set,
+                'path': backward[::-1] + forward[1:]
+            }
+
+    def is_done(self):
+        """
+        Stopping rule: no path through an unexpanded node can be cheaper than the best path found,
+        since the f values in either frontier are lower bounds on the cost of any such path
+        """
+        for direction, open_set in enumerate(self.open_sets):
+            node = open_set.peek()
+            if self.g[direction][node] + self.h[direction][node] >= self.best_cost:
+                return True
+        return False
+
+    def expand(self, node, direction):
+        """
+        Generates the neighbours of a node in the given direction, relaxing their g values and
+        recording any cheaper path through a node labeled by both searches
+        :param node: The node to expand
+        :param direction: 0 for the forward search, 1 for the backward search
+        """
+        g, parent_of, open_set = self.g[direction], self.parents[direction], self.open_sets[direction]
+        other_g = self.g[1 - direction]
+
+        if direction == 0:
+            neighbours = self.problem.get_all_successor_nodes(node) or []
+        else:
+            neighbours = self.problem.get_all_predecessor_nodes(node) or []
+
+        for neighbour in neighbours:
+            if direction == 0:
+                cost = g[node] + self.problem.edge_cost(node, neighbour)
+            else:
+                cost = g[node] + self.problem.edge_cost(neighbour, node)
+            if neighbour in g and cost >= g[neighbour]:
+                continue
+
+            g[neighbour] = cost
+            parent_of[neighbour] = node
+            if neighbour not in self.h[direction]:
+                self.h[direction][neighbour] = self.estimate(neighbour, direction)
+
+            if neighbour in open_set:
+                open_set.update(neighbour)
+            else:
+                self.closed_sets[direction].discard(neighbour)
+                open_set.push(neighbour)
+
+            if neighbour in other_g and cost + other_g[neighbour] < self.best_cost:
+                self.best_cost = cost + other_g[neighbour]
+                self.meeting_node = neighbour
+
+    def estimate(self, node, direction):
+        """
+        Front-to-end heuristic towards the root of the opposite search
+        """
+        if direction == 0:
+            return self.problem.heuristic(node)
+        return self.problem.reverse_heuristic(node)
+
+    def get_path_from_node(self, path, direction=0):
+        """
+        Returns the path from the given node back to the root of the search in the given direction
+        :param path: A list containing the node to start from
+        :param direction: 0 to walk back to the start node, 1 to walk back to the goal node
+        """
+        parent_of = self.parents[direction]
+        while path[-1] in parent_of:
+            path.append(parent_of[path[-1]])
+        return path[::]
+
+
+class LPAStar(AStar):
+    """
+    Lifelong Planning A* (LPA*), an incremental A* for a fixed start and goal. It keeps its g values between
+    searches, so after some nodes change (walkability or arc cost) only the affected part of the search tree is
+    repaired instead of searching from scratch. Nodes must expose the walkable flag, like grid cells do.
+    :param problem: The problem to plan on. It must have a goal node
+    """
+
+    def __init__(self, problem=None):
+        """
+        Initializing the LPA* object with the given problem
+        """
+        super(LPAStar, self).__init__(mode='best', problem=problem)
+
+        self.goal_node = self.problem.get_goal_node()
+        if self.goal_node is None:
+            raise Exception("LPA* requires a problem with a goal node")
+
+        self.g = {}
+        self.rhs = {self.start_node: 0}
+        self.keys = {}
+        self.open_set = PriorityQueue(key=lambda node: self.keys[node])
+
+        self.keys[self.start_node] = self.calculate_key(self.start_node)
+        self.open_set.push(self.start_node)
+
+    def calculate_key(self, node):
+        """
+        The priority of a node, ordering by f and breaking ties on g, where g is the smaller of g and rhs
+        """
+        g = min(self.g.get(node, INFINITY), self.rhs.get(node, INFINITY))
+        return g + self.problem.heuristic(node), g
+
+    def update_node(self, node):
+        """
+        Recomputes the one-step lookahead value (rhs) of a node from its predecessors, and queues the node
+        if it became locally inconsistent
+        :param node: The node to update
+        """
+        if node is not self.start_node:
+            rhs = INFINITY
+            if node.walkable:
+                for predecessor in self.problem.get_all_predecessor_nodes(node) or []:
+                    rhs = min(rhs, self.g.get(predecessor, INFINITY) + self.problem.edge_cost(predecessor, node))
+            self.rhs[node] = rhs
+
+        if node in self.open_set:
+            self.open_set.remove(node)
+        if self.g.get(node, INFINITY) != self.rhs.get(node, INFINITY):
+            self.keys[node] = self.calculate_key(node)
+            self.open_set.push(node)
+
+    def agenda_loop(self, trace=True):
+        """
+        Expands locally inconsistent nodes until the goal is consistent and no queued node can improve it
+        :param trace: Whether to yield a step for every expansion. If False, only the final step is yielded
+        """
+        self.expanded = 0
+        self.closed_set = set()
+
+        while self.open_set and (self.keys[self.open_set.peek()] < self.calculate_key(self.goal_node) or
+                                 self.rhs.get(self.goal_node, INFINITY) != self.g.get(self.goal_node, INFINITY)):
+            node = self.open_set.pop()
+            self.closed_set.add(node)
+            self.expanded += 1
+
+            if self.g.get(node, INFINITY) > self.rhs[node]:
+                self.g[node] = self.rhs[node]
+            else:
+                self.g[node] = INFINITY
+                self.update_node(node)
+
+            for successor in self.problem.get_all_successor_nodes(node) or []:
+                self.update_node(successor)
+
+            if trace:
+                yield {
+                    'open_set': self.open_set,
+                    'closed_set': self.closed_set,
+                    'path': self.get_path_from_node([node])
+                }
+
+        if self.g.get(self.goal_node, INFINITY) < INFINITY:
+            log('Reached the goal node for this problem instance')
+            yield {
+                'open_set': self.open_set,
+                'closed_set': self.closed_set,
+                'path': self.get_path_from_node([self.goal_node])
+            }
+
+    def replan(self, nodes):
+        """
+        Repairs the search after the given nodes changed walkability or arc cost, and returns the updated path
+        :param nodes: The nodes that changed
+        :return: A dict like the one returned by solve, where expanded only counts the work done by this replan
+        """
+        for node in nodes:
+            self.update_node(node)
+            for neighbour in self.problem.get_all_successor_nodes(node) or []:
+                self.update_node(neighbour)
+
+        self.path = []
+        return self.solve()
+
+    def get_path_from_node(self, path):
+        """
+        Returns the path from the given node back to the start node, following the cheapest predecessors
+        :param path: A list containing the node to start from
+        """
+        visited = set(path)
+        while path[-1] is not self.start_node and self.g.get(path[-1], INFINITY) < INFINITY:
+            node = path[-1]
+            predecessor = min(
+                self.problem.get_all_predecessor_nodes(node) or [],
+                key=lambda p: self.g.get(p, INFINITY) + self.problem.edge_cost(p, node),
+                default=None
+            )
+            if predecessor is None or predecessor in visited:
+                break
+            visited.add(predecessor)
+            path.append(predecessor)
+        return path[::]
+
 # --- Generalized Arc Constraint ---
 
 GAC_DEFAULT_CONSTRAINT = 'x != y'
 GAC_DEFAULT_K = 4
+GAC_TABLE_LIMIT = 256
+NO_SUPPORT = object()
 
 
 class GAC(object):
@@ -185,52 +532,175 @@ class GAC(object):
         self.csp_state = csp_state
         self.cnet = cnet
         self.cf = cf
-        self.queue = []
+        self.queue = deque()
+        self.queued = set()
+        self.residues = {}
+        self.supports = {}
+        self.tables = {}
+
+        # Constraint weights, increased every time a constraint empties a domain
+        self.weights = {}
+
+        # Statistics: number of revise calls, and number of domain values removed
+        self.revisions = 0
+        self.removals = 0
 
     def initialize(self):
         """
-        Initializes the queue with all constraint permutations
+        Initializes the queue with all constraint permutations, and compiles the constraint tables
         :return:
         """
+        self.compile_constraints()
         for node, edges in self.cnet.items():
-            self.queue.extend((node, edge) for edge in edges)
+            for edge in edges:
+                self.enqueue(node, edge)
 
         log('Queue initialized with %d pairs' % len(self.queue))
 
-    def revise(self, from_node):
+    def compile_constraints(self):
+        """
+        Compiles the constraint function into a support table for every arc between set or list domains with
+        at most GAC_TABLE_LIMIT value pairs. A table maps each value of from_node to the frozenset of values of
+        to_node consistent with it, so revise answers with set lookups instead of calling the constraint function.
+        Arcs between equal domains share their table. Tables cover the current domains, which later states only
+        shrink, and values outside them fall back to calling the constraint function
+        """
+        domains = self.csp_state.nodes
+        compiled = {}
+        for from_node, arcs in self.cnet.items():
+            for to_node in arcs:
+                xs, ys = domains[from_node], domains[to_node]
+                if isinstance(xs, BitDomain) or len(xs) * len(ys) > GAC_TABLE_LIMIT:
+                    continue
+                key = (frozenset(xs), frozenset(ys))
+                if key not in compiled:
+                    compiled[key] = {x: frozenset(y for y in ys if self.cf(x, y)) for x in xs}
+                self.tables[(from_node, to_node)] = compiled[key]
+
+        log('Compiled constraint tables for %d arcs' % len(self.tables))
+
+    def enqueue(self, from_node, to_node):
         """
-        Removes all inconsistent values in a domain for all possible arc from an node
+        Adds a revise pair to the queue, unless it is already waiting in it
+        :param from_node: The node whose domain is to be revised
+        :param to_node: The node the revision was triggered by
+        """
+        pair = (from_node, to_node)
+        if pair not in self.queued:
+            self.queued.add(pair)
+            self.queue.append(pair)
+
+    def revise(self, from_node, to_node):
+        """
+        Removes all values in the domain of from_node that have no support in the domain of to_node
         It also saves to the csp_state if the current state is a contradiction
-        :param from_node: The node to run revise from
+        Arcs with a compiled constraint table are answered by lookup in it. Otherwise the last support found
+        for each (from_node, to_node, value) is kept as a residue and checked before scanning the domain again.
+        Residues are only hints, so they stay valid across search states
+        :param from_node: The node whose domain is revised
+        :param to_node: The node at the other end of the arc
         :return: Boolean telling whether the domain was revised or not
         """
+        self.revisions += 1
+        domain = self.csp_state.nodes[from_node]
+        other_domain = self.csp_state.nodes[to_node]
+        if isinstance(domain, BitDomain):
+            return self.revise_bits(from_node, to_node, domain, other_domain)
+
+        other_members = other_domain if isinstance(other_domain, (set, frozenset)) else None
+        table = self.tables.get((from_node, to_node))
         to_be_removed = []
-        for arc in self.cnet[from_node]:
-            for domain in self.csp_state.nodes[from_node]:
-                remove = True
-                for x, y in product([domain], self.csp_state.nodes[arc]):
-                    if self.cf(x, y):
-                        remove = False
-                        break
-
-                if remove:
-                    if DEBUG:
-                        print('Removing domain %s from %s' % (str(domain), from_node))
-                    to_be_removed.append(domain)
-
-        for domain in to_be_removed:
-            if domain in self.csp_state.nodes[from_node]:
-                self.csp_state.nodes[from_node].remove(domain)
 
-        if to_be_removed:
-            if not self.csp_state.nodes[from_node]:
-                self.csp_state.contradiction = True
+        for value in domain:
+            supports = table.get(value) if table is not None else None
+            if supports is not None:
+                if supports.isdisjoint(other_domain):
+                    to_be_removed.append(value)
+                continue
+
+            key = (from_node, to_node, value)
+            residue = self.residues.get(key, NO_SUPPORT)
+            if residue is not NO_SUPPORT:
+                if other_members is None:
+                    other_members = set(other_domain)
+                if residue in other_members:
+                    continue
+
+            for support in other_domain:
+                if self.cf(value, support):
+                    self.residues[key] = support
+                    break
+            else:
                 if DEBUG:
-                    print('Contradiction')
+                    print('Removing domain %s from %s' % (str(value), from_node))
+                to_be_removed.append(value)
+
+        if to_be_removed:
+            if isinstance(domain, set):
+                domain = domain.difference(to_be_removed)
+            else:
+                removed = set(to_be_removed)
+                domain = [value for value in domain if value not in removed]
+            self.csp_state.set_domain(from_node, domain)
+            self.removals += len(to_be_removed)
+
+            if not domain:
+                self.wipeout(from_node, to_node)
             return True
 
         return False
 
+    def support_masks(self, from_node, to_node, domain, other_domain):
+        """
+        Fetches the support masks of an arc between bitset domains, computing them on first use.
+        Entry i is the mask of values in the universe of to_node that are consistent with value i of from_node.
+        The constraint function only sees values, so arcs between the same pair of universes share their masks
+        :return: List of support masks, indexed by value position in the universe of from_node
+        """
+        key = (id(domain.values), id(other_domain.values))
+        entry = self.supports.get(key)
+        if entry is None or entry[0] is not domain.values or entry[1] is not other_domain.values:
+            masks = [
+                sum(1 << j for j, support in enumerate(other_domain.values) if self.cf(value, support))
+                for value in domain.values
+            ]
+            entry = self.supports[key] = (domain.values, other_domain.values, masks)
+        return entry[2]
+
+    def revise_bits(self, from_node, to_node, domain, other_domain):
+        """
+        Revise for bitset domains. A value is kept if its support mask intersects the domain of to_node
+        :return: Boolean telling whether the domain was revised or not
+        """
+        masks = self.support_masks(from_node, to_node, domain, other_domain)
+        other = other_domain.mask
+        kept = remaining = domain.mask
+        while remaining:
+            low = remaining & -remaining
+            if not masks[low.bit_length() - 1] & other:
+                kept ^= low
+            remaining ^= low
+
+        if kept == domain.mask:
+            return False
+
+        self.removals += bin(domain.mask ^ kept).count('1')
+        self.csp_state.set_domain(from_node, domain.derive(kept))
+        if not kept:
+            self.wipeout(from_node, to_node)
+        return True
+
+    def wipeout(self, from_node, to_node):
+        """
+        Flags the current state as a contradiction after the domain of from_node was emptied by revising
+        against to_node, and increases the weight of the constraint between them
+        """
+        self.csp_state.contradiction = True
+        weight = self.weights.get((from_node, to_node), 1) + 1
+        self.weights[(from_node, to_node)] = self.weights[(to_node, from_node)] = weight
+        if DEBUG:
+            print('Contradiction')
+
     def domain_filtering_loop(self):
         """
         Pops of all todo revise pairs from the queue and runs revise on the from_node
@@ -238,11 +708,13 @@ class GAC(object):
         check for further domain reductions possible
         """
         while self.queue:
-            from_node, to_node = self.queue.pop(0)
-            if self.revise(from_node):
+            pair = self.queue.popleft()
+            self.queued.discard(pair)
+            from_node, to_node = pair
+            if self.revise(from_node, to_node):
                 for arc in self.cnet[from_node]:
                     if arc != from_node:
-                        self.queue.append((arc, from_node))
+                        self.enqueue(arc, from_node)
 
     def run_again(self, node):
         """
@@ -251,5 +723,131 @@ class GAC(object):
         """
         for arc in self.cnet[node]:
             if node != arc:
-                self.queue.append((arc, node))
+                self.enqueue(arc, node)
         self.domain_filtering_loop()
+
+    def propagate(self, csp_state, node):
+        """
+        Runs the domain filtering loop on the given state after the domain of a node was reduced.
+        The loop runs with its own queue, and the state and queue of the GAC are restored afterwards, so
+        propagate can be called again from within a propagation, for instance by a constraint function
+        :param csp_state: The state to filter
+        :param node: The node whose domain was reduced
+        """
+        previous = self.csp_state, self.queue, self.queued
+        self.csp_state, self.queue, self.queued = csp_state, deque(), set()
+        try:
+            self.run_again(node)
+        finally:
+            self.csp_state, self.queue, self.queued = previous
+
+    def branch(self, csp_state, node, values):
+        """
+        Creates one filtered child state per value, with the node assigned to that value
+        :param csp_state: The state to branch from
+        :param node: The node to assign
+        :param values: The values to assign the node to
+        :return: List of child states, in the same order as the values. Children may be contradictions
+        """
+        children = []
+        for value in values:
+            child = csp_state.fork()
+            child.assign(node, value)
+            self.propagate(child, node)
+            children.append(child)
+        return children
+
+
+# Per process GAC and codec of the worker processes of a GACPool, inherited when the workers are forked
+_worker_gac = None
+_worker_codec = None
+
+
+def _init_gac_worker(gac, codec):
+    global _worker_gac, _worker_codec
+    _worker_gac = gac
+    _worker_codec = codec
+
+
+def _branch_gac_worker(task):
+    """
+    Assigns a value to a node in a decoded state and filters it
+    :param task: Tuple of the encoded parent domains, the node and the value
+    :return: Tuple of the encoded changed domains (None on contradiction), revisions and removals
+    """
+    masks, node, value = task
+    revisions, removals = _worker_gac.revisions, _worker_gac.removals
+    state = CSPState(_worker_codec.decode_all(masks))
+    child = state.fork()
+    child.assign(node, value)
+    _worker_gac.propagate(child, node)
+
+    changes = None
+    if not child.contradiction:
+        changes = {changed: _worker_codec.encode(changed, new) for changed, old, new in child.changes}
+    return changes, _worker_gac.revisions - revisions, _worker_gac.removals - removals
+
+
+class GACPool(object):
+    """
+    Branches CSP states over a pool of worker processes, each running its own copy of a GAC.
+    Parent domains and child changes are sent as bitmasks over the root domains, see DomainCodec.
+    Workers are forked, so constraint functions do not need to be picklable, and the pool is only available
+    where the fork start method is, see supported(). Constraint weights and residues stay in the workers, while
+    the revision and removal counts are added to the given GAC. The pool is a context manager closing itself
+    """
+
+    def __init__(self, gac, processes=None):
+        """
+        Constructor. The current state of the GAC is used as the root state for encoding domains
+        :param gac: The initialized and filtered GAC
+        :param processes: Number of worker processes, defaults to the number of cores
+        :raises Exception: If the platform cannot fork worker processes
+        """
+        if not GACPool.supported():
+            raise Exception('GACPool needs the fork start method, which this platform does not provide')
+        self.gac = gac
+        self.codec = DomainCodec(gac.csp_state.nodes)
+        self.pool = multiprocessing.get_context('fork').Pool(
+            processes=processes, initializer=_init_gac_worker, initargs=(gac, self.codec)
+        )
+
+    def branch(self, csp_state, node, values):
+        """
+        Same as GAC.branch, with the filtering of the children done in the worker processes
+        """
+        masks = self.codec.encode_all(csp_state.nodes)
+        results = self.pool.map(_branch_gac_worker, [(masks, node, value) for value in values], chunksize=1)
+
+        children = []
+        for changes, revisions, removals in results:
+            self.gac.revisions += revisions
+            self.gac.removals += removals
+            child = csp_state.fork()
+            if changes is None:
+                child.contradiction = True
+            else:
+                for changed, mask in changes.items():
+                    child.set_domain(changed, self.codec.decode(changed, mask))
+            children.append(child)
+        return children
+
+    @staticmethod
+    def supported():
+        """
+        :return: Whether worker processes can be forked on this platform
+        """
+        return 'fork' in multiprocessing.get_all_start_methods()
+
+    def close(self):
+        """
+        Stops the worker processes
+        """
+        self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,513 @@
+# -*- coding: utf8 -*-
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from algorithms import AStar, ASTAR_OPTIONS, BidirectionalAStar, GAC, LPAStar
+from common import fetch_files_from_dir, TIMEOUT_THRESHOLD
+from datastructures import Graph
+from module1.navigation import CompactNavigationProblem, JumpPointNavigationProblem, NavigationProblem, PathService, \
+    convert_board, load_landmarks, read_text_board
+from module2.vc import VALUE_ORDERS, VARIABLE_ORDERS, VCProblem
+from module3.nonogram import LineDomain, LineGAC, NonogramProblem
+
+
+class FullRevisionGAC(GAC):
+    """
+    The original GAC revise, which rescans the neighbour domains of every arc from a node on each revision.
+    Kept as a baseline for the residual support revise
+    """
+
+    def revise(self, from_node, to_node):
+        self.revisions += 1
+        to_be_removed = []
+        for arc in self.cnet[from_node]:
+            for domain in self.csp_state.nodes[from_node]:
+                remove = True
+                for y in self.csp_state.nodes[arc]:
+                    if self.cf(domain, y):
+                        remove = False
+                        break
+                if remove:
+                    to_be_removed.append(domain)
+
+        if to_be_removed:
+            domain = type(self.csp_state.nodes[from_node])(self.csp_state.nodes[from_node])
+            for value in to_be_removed:
+                if value in domain:
+                    domain.remove(value)
+                    self.removals += 1
+            self.csp_state.set_domain(from_node, domain)
+
+            if not domain:
+                self.csp_state.contradiction = True
+            return True
+        return False
+
+
+def scale_board(board_path, size):
+    """
+    Writes a copy of a board scaled up so that its widest side spans the given number of cells
+    Start, goal and obstacle rectangles are scaled by the same factor
+    :param board_path: Path to the original board file
+    :param size: The number of cells along the widest side of the scaled board
+    :return: Path to a temporary file holding the scaled board
+    """
+
+    with open(board_path) as f:
+        width, height = map(int, f.readline().split())
+        factor = max(1, size // max(width, height))
+        sx, sy, gx, gy = map(int, f.readline().split())
+        obstacles = [tuple(map(int, line.split())) for line in f if line.strip()]
+
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    with os.fdopen(fd, 'w') as f:
+        f.write('%d %d\n' % (width * factor, height * factor))
+        f.write('%d %d %d %d\n' % (sx * factor, sy * factor, gx * factor, gy * factor))
+        for ox, oy, ow, oh in obstacles:
+            f.write('%d %d %d %d\n' % (ox * factor, oy * factor, ow * factor, oh * factor))
+
+    return path
+
+
+def benchmark_modes(size):
+    """
+    Runs all A* agenda modes on every module1 board scaled up to size x size and prints the timings
+    :param size: The number of cells along the widest side of the scaled boards
+    """
+
+    print('%-12s %-5s %10s %10s %10s' % ('board', 'mode', 'expanded', 'path', 'seconds'))
+    for board in sorted(fetch_files_from_dir(rootdir='module1/boards/')):
+        scaled = scale_board(board, size)
+        try:
+            for mode in ASTAR_OPTIONS:
+                problem = NavigationProblem(scaled)
+                t = time.time()
+                result = AStar(mode=mode, problem=problem).solve()
+                print('%-12s %-5s %10d %10d %10.3f' % (
+                    os.path.basename(board), mode, result['expanded'], len(result['path']) - 1, time.time() - t
+                ))
+        finally:
+            os.remove(scaled)
+
+
+def benchmark_bidirectional(size):
+    """
+    Compares the expanded node counts of unidirectional and bidirectional A* on the scaled up module1 boards
+    :param size: The number of cells along the widest side of the scaled boards
+    """
+
+    print('%-12s %-13s %10s %10s %10s' % ('board', 'search', 'expanded', 'path', 'seconds'))
+    for board in sorted(fetch_files_from_dir(rootdir='module1/boards/')):
+        scaled = scale_board(board, size)
+        try:
+            for name, make_solver in (('astar', lambda p: AStar(mode='best', problem=p)),
+                                      ('bidirectional', lambda p: BidirectionalAStar(problem=p))):
+                problem = NavigationProblem(scaled)
+                t = time.time()
+                result = make_solver(problem).solve()
+                print('%-12s %-13s %10d %10d %10.3f' % (
+                    os.path.basename(board), name, result['expanded'], len(result['path']) - 1, time.time() - t
+                ))
+        finally:
+            os.remove(scaled)
+
+
+def benchmark_jps(size):
+    """
+    Compares the expanded node counts of A* with adjacent cell successors and with jump point successors
+    :param size: The number of cells along the widest side of the scaled boards
+    """
+
+    print('%-12s %-9s %10s %10s %10s' % ('board', 'successor', 'expanded', 'cost', 'seconds'))
+    for board in sorted(fetch_files_from_dir(rootdir='module1/boards/')):
+        scaled = scale_board(board, size)
+        try:
+            for name, problem_class in (('adjacent', NavigationProblem), ('jps', JumpPointNavigationProblem)):
+                problem = problem_class(scaled)
+                t = time.time()
+                result = AStar(mode='best', problem=problem).solve()
+                print('%-12s %-9s %10d %10d %10.3f' % (
+                    os.path.basename(board), name, result['expanded'], problem.get_goal_node().g, time.time() - t
+                ))
+        finally:
+            os.remove(scaled)
+
+
+def benchmark_compact(size):
+    """
+    Compares peak memory and run time of the object and array backed grids when loading and solving boards
+    :param size: The number of cells along the widest side of the scaled boards
+    """
+
+    print('%-12s %-9s %10s %10s %10s' % ('board', 'grid', 'expanded', 'peak MB', 'seconds'))
+    for board in sorted(fetch_files_from_dir(rootdir='module1/boards/')):
+        scaled = scale_board(board, size)
+        try:
+            for name, problem_class in (('objects', NavigationProblem), ('compact', CompactNavigationProblem)):
+                tracemalloc.start()
+                t = time.time()
+                result = AStar(mode='best', problem=problem_class(scaled)).solve()
+                elapsed = time.time() - t
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print('%-12s %-9s %10d %10.1f %10.3f' % (
+                    os.path.basename(board), name, result['expanded'], peak / 2 ** 20, elapsed
+                ))
+        finally:
+            os.remove(scaled)
+
+
+def benchmark_nodes(size):
+    """
+    Measures the memory and time spent constructing node objects when loading the scaled up module1 boards
+    and the module2 graphs
+    :param size: The number of cells along the widest side of the scaled boards
+    """
+
+    def measure(name, load, count):
+        t = time.time()
+        load()
+        elapsed = time.time() - t
+        tracemalloc.start()
+        result = load()
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        nodes = count(result)
+        print('%-14s %10d %10.1f %12.1f %10.3f' % (name, nodes, current / 2 ** 20, current / nodes, elapsed))
+
+    print('%-14s %10s %10s %12s %10s' % ('input', 'nodes', 'MB', 'bytes/node', 'seconds'))
+    for board in sorted(fetch_files_from_dir(rootdir='module1/boards/')):
+        scaled = scale_board(board, size)
+        try:
+            measure(os.path.basename(board), lambda: NavigationProblem(scaled),
+                    lambda problem: len(problem.grid) * len(problem.grid[0]))
+        finally:
+            os.remove(scaled)
+
+    for graph in sorted(fetch_files_from_dir(rootdir='module2/graphs/')):
+        measure(os.path.basename(graph), lambda: Graph.read_graph_from_file(graph), lambda result: len(result[0]))
+
+
+def benchmark_replan(size, rounds=10):
+    """
+    Compares a cold A* run with LPA* replanning after blocking a random cell on the current path
+    :param size: The number of cells along the widest side of the scaled boards
+    :param rounds: Number of replanning rounds per board
+    """
+
+    rng = random.Random(size)
+    print('%-12s %-6s %10s %10s %10s' % ('board', 'search', 'expanded', 'path', 'seconds'))
+    for board in sorted(fetch_files_from_dir(rootdir='module1/boards/')):
+        scaled = scale_board(board, size)
+        try:
+            problem = NavigationProblem(scaled)
+            planner = LPAStar(problem=problem)
+            result = planner.solve()
+            blocked = []
+            totals = {'astar': [0, 0.0], 'lpa': [0, 0.0]}
+            for _ in range(rounds):
+                if len(result['path']) < 3:
+                    break
+                node = rng.choice(result['path'][1:-1])
+                blocked.append((node.x, node.y))
+
+                t = time.time()
+                result = planner.replan([problem.set_cell(node.x, node.y, walkable=False)])
+                totals['lpa'][0] += result['expanded']
+                totals['lpa'][1] += time.time() - t
+
+                cold = NavigationProblem(scaled)
+                for x, y in blocked:
+                    cold.set_cell(x, y, walkable=False)
+                t = time.time()
+                totals['astar'][0] += AStar(mode='best', problem=cold).solve()['expanded']
+                totals['astar'][1] += time.time() - t
+
+            for name, (expanded, seconds) in sorted(totals.items()):
+                print('%-12s %-6s %10d %10d %10.3f' % (
+                    os.path.basename(board), name, expanded, len(result['path']) - 1, seconds
+                ))
+        finally:
+            os.remove(scaled)
+
+
+def benchmark_gac(size, k=4, timeout=TIMEOUT_THRESHOLD):
+    """
+    Compares the residual support GAC revise with the original full revision on the module2 graphs and
+    module3 nonograms, solving each with A*. Nonograms are also solved with the line revision of LineGAC
+    :param size: Unused, the inputs are not scaled
+    :param k: Number of colors for the vertex coloring problems
+    :param timeout: Searches are stopped after this many seconds
+    """
+
+    def problems():
+        for graph in sorted(fetch_files_from_dir(rootdir='module2/graphs/')):
+            nodes, edges = Graph.read_graph_from_file(graph, lightweight=True)
+            yield os.path.basename(graph), variants, lambda gac, n=nodes, e=edges: type(
+                'Problem', (VCProblem,), {'gac_class': gac})({node: set(range(k)) for node in n}, e)
+        for nonogram in sorted(fetch_files_from_dir(rootdir='module3/nonograms/')):
+            yield os.path.basename(nonogram), variants + (('line', LineGAC),), lambda gac, path=nonogram: type(
+                'Problem', (NonogramProblem,), {'gac_class': gac})(path)
+
+    variants = (('full', FullRevisionGAC), ('residual', GAC))
+
+    print('%-22s %-9s %10s %10s %10s %8s' % ('input', 'revise', 'revisions', 'removals', 'seconds', 'solved'))
+    for name, gac_classes, make_problem in problems():
+        for label, gac_class in gac_classes:
+            t = time.time()
+            problem = make_problem(gac_class)
+            solved = False
+            for step in AStar(problem=problem).agenda_loop():
+                solved = bool(step['path'][0].is_goal)
+                if time.time() - t > timeout:
+                    break
+            elapsed = time.time() - t
+            print('%-22s %-9s %10d %10d %10.3f %8s' % (
+                name, label, problem.gac.revisions, problem.gac.removals, elapsed, solved
+            ))
+
+
+def benchmark_domains(size, k=4, timeout=TIMEOUT_THRESHOLD):
+    """
+    Compares set and bitset domains when solving the module2 graphs with A* and GAC
+    :param size: Unused, the graphs are not scaled
+    :param k: Number of colors for the vertex coloring problems
+    :param timeout: Searches are stopped after this many seconds
+    """
+
+    print('%-12s %-7s %10s %10s %10s %8s' % ('graph', 'domain', 'expanded', 'removals', 'seconds', 'solved'))
+    for graph in sorted(fetch_files_from_dir(rootdir='module2/graphs/')):
+        nodes, edges = Graph.read_graph_from_file(graph, lightweight=True)
+        for backend in ('set', 'bitset'):
+            t = time.time()
+            problem = VCProblem({node: set(range(k)) for node in nodes}, edges, backend=backend)
+            solver = AStar(problem=problem)
+            solved = False
+            for step in solver.agenda_loop():
+                solved = bool(step['path'][0].is_goal)
+                if time.time() - t > timeout:
+                    break
+            print('%-12s %-7s %10d %10d %10.3f %8s' % (
+                os.path.basename(graph), backend, solver.expanded, problem.gac.removals, time.time() - t, solved
+            ))
+
+
+def benchmark_ordering(size, k=4, timeout=20):
+    """
+    Compares the variable and value orderings of VCProblem on the module2 graphs
+    :param size: Unused, the graphs are not scaled
+    :param k: Number of colors for the vertex coloring problems
+    :param timeout: Searches are stopped after this many seconds
+    """
+
+    print('%-12s %-8s %-8s %10s %10s %10s %8s' % (
+        'graph', 'variable', 'value', 'expanded', 'failures', 'seconds', 'solved'
+    ))
+    for graph in sorted(fetch_files_from_dir(rootdir='module2/graphs/')):
+        nodes, edges = Graph.read_graph_from_file(graph, lightweight=True)
+        for variable_order in VARIABLE_ORDERS:
+            for value_order in VALUE_ORDERS:
+                t = time.time()
+                problem = VCProblem({node: set(range(k)) for node in nodes}, edges,
+                                    variable_order=variable_order, value_order=value_order)
+                solver = AStar(problem=problem)
+                solved = False
+                for step in solver.agenda_loop():
+                    solved = bool(step['path'][0].is_goal)
+                    if time.time() - t > timeout:
+                        solved = None
+                        break
+                print('%-12s %-8s %-8s %10d %10d %10.3f %8s' % (
+                    os.path.basename(graph), variable_order, value_order, solver.expanded, problem.failures,
+                    time.time() - t, solved
+                ))
+
+
+def benchmark_parallel(size, k=6, timeout=TIMEOUT_THRESHOLD):
+    """
+    Compares filtering the children of every expansion in this process and in a process pool, on the module2
+    graphs and module3 nonograms
+    :param size: Unused, the inputs are not scaled
+    :param k: Number of colors for the vertex coloring problems
+    :param timeout: Searches are stopped after this many seconds
+    """
+
+    def problems():
+        for graph in sorted(fetch_files_from_dir(rootdir='module2/graphs/')):
+            nodes, edges = Graph.read_graph_from_file(graph, lightweight=True)
+            yield os.path.basename(graph), lambda processes, n=nodes, e=edges: VCProblem(
+                {node: set(range(k)) for node in n}, e, variable_order='mrv', processes=processes)
+        for nonogram in sorted(fetch_files_from_dir(rootdir='module3/nonograms/')):
+            yield os.path.basename(nonogram), lambda processes, path=nonogram: NonogramProblem(
+                path, processes=processes)
+
+    print('%-22s %9s %10s %10s %8s' % ('input', 'processes', 'expanded', 'seconds', 'solved'))
+    for name, make_problem in problems():
+        for processes in (0, os.cpu_count()):
+            t = time.time()
+            problem = make_problem(processes)
+            solver = AStar(problem=problem)
+            solved = False
+            try:
+                for step in solver.agenda_loop():
+                    solved = bool(step['path'][0].is_goal)
+                    if time.time() - t > timeout:
+                        solved = None
+                        break
+            finally:
+                problem.close()
+            print('%-22s %9d %10d %10.3f %8s' % (name, processes, solver.expanded, time.time() - t, solved))
+
+
+def benchmark_patterns(size):
+    """
+    Compares the number of patterns of every module3 nonogram without fixed cells, counted without enumerating
+    them, with the number enumerated after inference, and measures loading time and peak memory
+    :param size: Unused, the nonograms are not scaled
+    """
+
+    print('%-22s %14s %12s %10s %10s' % ('nonogram', 'all patterns', 'enumerated', 'peak MB', 'seconds'))
+    for nonogram in sorted(fetch_files_from_dir(rootdir='module3/nonograms/')):
+        tracemalloc.start()
+        t = time.time()
+        problem = NonogramProblem(nonogram)
+        elapsed = time.time() - t
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        total = sum(NonogramProblem.count_patterns(counts, problem.line_length(node))
+                    for node, counts in problem.clues.items())
+        print('%-22s %14d %12d %10.1f %10.3f' % (
+            os.path.basename(nonogram), total,
+            sum(len(domain) for domain in problem.nodes.values() if not isinstance(domain, LineDomain)),
+            peak / 2 ** 20, elapsed
+        ))
+
+
+def benchmark_binary(size):
+    """
+    Compares loading time and peak memory of scaled boards in the text format and the memory mapped binary format
+    :param size: The number of cells along the widest side of the scaled boards
+    """
+
+    print('%-12s %-7s %-9s %10s %10s %10s' % ('board', 'format', 'grid', 'expanded', 'peak MB', 'load s'))
+    for board in sorted(fetch_files_from_dir(rootdir='module1/boards/')):
+        scaled = scale_board(board, size)
+        binary = convert_board(scaled)
+        try:
+            for format_name, path in (('text', scaled), ('binary', binary)):
+                for name, problem_class in (('objects', NavigationProblem), ('compact', CompactNavigationProblem)):
+                    tracemalloc.start()
+                    t = time.time()
+                    problem = problem_class(path)
+                    elapsed = time.time() - t
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    result = AStar(mode='best', problem=problem).solve()
+                    print('%-12s %-7s %-9s %10d %10.1f %10.3f' % (
+                        os.path.basename(board), format_name, name, result['expanded'], peak / 2 ** 20, elapsed
+                    ))
+        finally:
+            os.remove(scaled)
+            os.remove(binary)
+
+
+def benchmark_queries(size, count=50, processes=2):
+    """
+    Compares answering a batch of random start/goal queries by loading a fresh NavigationProblem for each query,
+    with a PathService in this process and with a PathService spread over worker processes
+    :param size: The number of cells along the widest side of the scaled boards
+    :param count: Number of queries per board
+    :param processes: Number of worker processes for the parallel service
+    """
+
+    def reload(path, start, goal):
+        problem = NavigationProblem(path)
+        problem.start_node.is_start = problem.goal_node.is_goal = False
+        problem.start_node, problem.goal_node = problem.get_node(*start), problem.get_node(*goal)
+        problem.start_node.is_start = problem.goal_node.is_goal = True
+        return AStar(mode='best', problem=problem).solve()['expanded']
+
+    rng = random.Random(3105)
+    print('%-12s %-10s %10s %10s' % ('board', 'queries', 'expanded', 'seconds'))
+    for board in sorted(fetch_files_from_dir(rootdir='module1/boards/')):
+        scaled = scale_board(board, size)
+        try:
+            service = PathService.from_file(scaled)
+            free = [(x, y) for x in range(service.width) for y in range(service.height) if service.cells[y, x]]
+            queries = [tuple(rng.sample(free, 2)) for _ in range(count)]
+
+            t = time.time()
+            expanded = sum(reload(scaled, start, goal) for start, goal in queries)
+            print('%-12s %-10s %10d %10.3f' % (os.path.basename(board), 'reload', expanded, time.time() - t))
+            for name, workers in (('service', 0), ('pool', processes)):
+                t = time.time()
+                expanded = sum(result['expanded'] for result in service.query_all(queries, processes=workers))
+                print('%-12s %-10s %10d %10.3f' % (os.path.basename(board), name, expanded, time.time() - t))
+        finally:
+            os.remove(scaled)
+
+
+def benchmark_landmarks(size, count=50):
+    """
+    Compares the manhattan and landmark (ALT) heuristics on random queries over the scaled up module1 boards,
+    including the time to compute the landmark distances and to load them again from disk
+    :param size: The number of cells along the widest side of the scaled boards
+    :param count: Number of queries per board
+    """
+
+    rng = random.Random(3105)
+    print('%-12s %-10s %10s %10s' % ('board', 'heuristic', 'expanded', 'seconds'))
+    for board in sorted(fetch_files_from_dir(rootdir='module1/boards/')):
+        with tempfile.TemporaryDirectory() as directory:
+            scaled = scale_board(board, size)
+            path = shutil.move(scaled, directory)
+            _, _, cells = read_text_board(path)
+            for name in ('compute', 'load'):
+                t = time.time()
+                landmarks = load_landmarks(path, cells)
+                print('%-12s %-10s %10s %10.3f' % (os.path.basename(board), name, '', time.time() - t))
+
+            free = np.flatnonzero(cells)
+            width = cells.shape[1]
+            queries = [tuple((int(index) % width, int(index) // width) for index in rng.sample(list(free), 2))
+                       for _ in range(count)]
+            for mode, service in (('manhattan', PathService(cells)),
+                                  ('landmarks', PathService(cells, mode='landmarks', landmarks=landmarks))):
+                t = time.time()
+                expanded = sum(result['expanded'] for result in service.query_all(queries))
+                print('%-12s %-10s %10d %10.3f' % (os.path.basename(board), mode, expanded, time.time() - t))
+
+
+BENCHMARKS = {
+    'modes': benchmark_modes,
+    'bidirectional': benchmark_bidirectional,
+    'jps': benchmark_jps,
+    'compact': benchmark_compact,
+    'nodes': benchmark_nodes,
+    'replan': benchmark_replan,
+    'gac': benchmark_gac,
+    'domains': benchmark_domains,
+    'ordering': benchmark_ordering,
+    'parallel': benchmark_parallel,
+    'patterns': benchmark_patterns,
+    'binary': benchmark_binary,
+    'queries': benchmark_queries,
+    'landmarks': benchmark_landmarks,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for the project 1 search algorithms')
+    parser.add_argument('benchmark', nargs='?', choices=sorted(BENCHMARKS), default='modes')
+    parser.add_argument('--size', type=int, default=1000, help='Size of the scaled up boards')
+    args = parser.parse_args()
+
+    BENCHMARKS[args.benchmark](args.size)
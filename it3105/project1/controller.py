@@ -54,6 +54,8 @@ class MainController(object):
             self.references['total_unsatisfied_constraints'].set('Unsatisfied constraints: 0')
         if 'total_missing_assignment' in self.references:
             self.references['total_missing_assignment'].set('Vertices missing assignment: 0')
+        if 'failed_assignments' in self.references:
+            self.references['failed_assignments'].set('Failed assignments: 0 (0 branches)')
 
     def set_window(self, window):
         """
@@ -210,6 +212,10 @@ class MainController(object):
                     )
                 )
 
+            # The search is done once the steps are scheduled, so worker processes can be stopped
+            if nonogram is not None:
+                nonogram.close()
+
         elif algorithm == 'astar_gac':
 
             g = self.window.renderer.graph
@@ -220,48 +226,66 @@ class MainController(object):
             n = {node.index: set([i for i in range(k)]) for node in n}
 
             cf = make_func(['x', 'y'], self.references['constraint_formula'].get())
-            vc_problem = VCProblem(n, e, cf=cf)
-            solver = AStar(problem=vc_problem)
+            vc_problem = VCProblem(
+                n, e, cf=cf, backend=self.references['backend'].get(),
+                variable_order=self.references['variable_order'].get(),
+                value_order=self.references['value_order'].get()
+            )
+            try:
+                self.solve_vc(vc_problem)
+            finally:
+                vc_problem.close()
 
-            t = time.time()
+    def solve_vc(self, vc_problem):
+        """
+        Runs A* on a vertex colouring problem, rendering every step and reporting the result
+        :param vc_problem: The VCProblem to solve
+        """
 
-            i = -1
-            last_node = None
-            for step in solver.agenda_loop():
-                i += 1
-                p = step['path']
-                last_node = p[0]
-                oss = len(step['open_set'])
-                css = len(step['closed_set'])
-
-                vma = sum(0 if len(y) - 1 == 0 else 1 for x, y in last_node.state.nodes.items())
-                tuc = sum(1 if len(y) == 0 else 0 for x, y in last_node.state.nodes.items())
-                self.references['total_missing_assignment'].set('Vertices missing assignment: %d' % vma)
-                self.references['total_unsatisfied_constraints'].set('Unsatisfied constraints: %d' % tuc)
-
-                self.window.renderer.render_path(
-                    p=p,
-                    open_set_size=oss,
-                    closed_set_size=css
-                )
+        solver = AStar(problem=vc_problem)
 
-                if time.time() - t > TIMEOUT_THRESHOLD:
-                    messagebox.showerror(
-                        'Timeout!',
-                        'Took too much time: %d steps in %f seconds...' % (i, time.time() - t)
-                    )
-                    break
+        t = time.time()
 
-            if last_node.is_goal:
-                messagebox.showinfo(
-                    'Complete!',
-                    'Found a solution in %f seconds...' % (time.time() - t)
-                )
-            else:
+        i = -1
+        last_node = None
+        for step in solver.agenda_loop():
+            i += 1
+            p = step['path']
+            last_node = p[0]
+            oss = len(step['open_set'])
+            css = len(step['closed_set'])
+
+            vma = sum(0 if len(y) - 1 == 0 else 1 for x, y in last_node.state.nodes.items())
+            tuc = sum(1 if len(y) == 0 else 0 for x, y in last_node.state.nodes.items())
+            self.references['total_missing_assignment'].set('Vertices missing assignment: %d' % vma)
+            self.references['total_unsatisfied_constraints'].set('Unsatisfied constraints: %d' % tuc)
+            self.references['failed_assignments'].set(
+                'Failed assignments: %d (%d branches)' % (vc_problem.failures, vc_problem.branches)
+            )
+
+            self.window.renderer.render_path(
+                p=p,
+                open_set_size=oss,
+                closed_set_size=css
+            )
+
+            if time.time() - t > TIMEOUT_THRESHOLD:
                 messagebox.showerror(
-                    'Complete!',
-                    'No solution could be found'
+                    'Timeout!',
+                    'Took too much time: %d steps in %f seconds...' % (i, time.time() - t)
                 )
+                break
+
+        if last_node.is_goal:
+            messagebox.showinfo(
+                'Complete!',
+                'Found a solution in %f seconds...' % (time.time() - t)
+            )
+        else:
+            messagebox.showerror(
+                'Complete!',
+                'No solution could be found'
+            )
 
     def exit(self):
         """
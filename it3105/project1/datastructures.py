@@ -1,14 +1,22 @@
 # -*- coding: utf-8 -*-
 
+from array import array
+from collections import deque
+from operator import lt
+
 from common import *
 
 
 class Node(object):
     """
     Basic Node object that keeps the foundational properties of a Node
-    that might be used in some sort of state or graph representation
+    that might be used in some sort of state or graph representation.
+    Nodes are slotted and only allocate their children set on first access, since
+    most nodes (like grid cells) are never expanded.
     """
 
+    __slots__ = ('index', 'x', 'y', 'parent', '_children')
+
     def __init__(self, index=None, x=None, y=None):
         """
         Constructor
@@ -18,7 +26,17 @@ class Node(object):
         self.x = x
         self.y = y
         self.parent = None
-        self.children = set()
+        self._children = None
+
+    @property
+    def children(self):
+        if self._children is None:
+            self._children = set()
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self._children = children
 
     def __str__(self):
         return 'N' + str(self.index)
@@ -31,6 +49,191 @@ class Node(object):
         return 'Node %d (%d, %d)' % (self.index, self.x, self.y)
 
 
+class PriorityQueue(object):
+    """
+    Indexed binary min-heap. Keeps a position map from item to heap index, so that
+    membership tests are O(1) and re-ordering an item after its key changed is O(log n).
+    Items must be hashable, and comparable with the < operator unless a key function is given.
+    """
+
+    def __init__(self, key=None):
+        """
+        Constructor
+        :param key: Optional function mapping an item to the value it is ordered by
+        """
+
+        self.heap = []
+        self.position = {}
+        self.less = lt if key is None else lambda a, b: key(a) < key(b)
+
+    def push(self, item):
+        """
+        Inserts an item into the heap
+        :param item: The item to insert
+        """
+
+        self.heap.append(item)
+        self.position[item] = len(self.heap) - 1
+        self._sift_up(len(self.heap) - 1)
+
+    def pop(self):
+        """
+        Removes and returns the smallest item in the heap
+        :return: The smallest item
+        """
+
+        last = self.heap.pop()
+        if not self.heap:
+            del self.position[last]
+            return last
+
+        item = self.heap[0]
+        del self.position[item]
+        self.heap[0] = last
+        self.position[last] = 0
+        self._sift_down(0)
+        return item
+
+    def remove(self, item):
+        """
+        Removes an arbitrary item from the heap
+        :param item: An item already in the heap
+        """
+
+        index = self.position.pop(item)
+        last = self.heap.pop()
+        if index < len(self.heap):
+            self.heap[index] = last
+            self.position[last] = index
+            self._sift_up(index)
+            self._sift_down(self.position[last])
+
+    def peek(self):
+        """
+        Returns the smallest item in the heap without removing it
+        :return: The smallest item
+        """
+
+        return self.heap[0]
+
+    def update(self, item):
+        """
+        Restores the heap invariant after the key of an item has changed
+        :param item: An item already in the heap
+        """
+
+        index = self.position[item]
+        self._sift_up(index)
+        self._sift_down(self.position[item])
+
+    def _swap(self, i, j):
+        self.heap[i], self.heap[j] = self.heap[j], self.heap[i]
+        self.position[self.heap[i]] = i
+        self.position[self.heap[j]] = j
+
+    def _sift_up(self, index):
+        while index > 0:
+            parent = (index - 1) >> 1
+            if not self.less(self.heap[index], self.heap[parent]):
+                break
+            self._swap(index, parent)
+            index = parent
+
+    def _sift_down(self, index):
+        size = len(self.heap)
+        while True:
+            smallest = index
+            left = 2 * index + 1
+            right = left + 1
+            if left < size and self.less(self.heap[left], self.heap[smallest]):
+                smallest = left
+            if right < size and self.less(self.heap[right], self.heap[smallest]):
+                smallest = right
+            if smallest == index:
+                break
+            self._swap(index, smallest)
+            index = smallest
+
+    def __contains__(self, item):
+        return item in self.position
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return iter(self.heap)
+
+
+class Queue(object):
+    """
+    Deque backed agenda with a membership set, giving O(1) insertion, removal and membership tests.
+    Pops in FIFO order by default, or LIFO order if lifo is set.
+    """
+
+    def __init__(self, lifo=False):
+        """
+        Constructor
+        :param lifo: Whether the queue should behave as a stack
+        """
+
+        self.lifo = lifo
+        self.items = deque()
+        self.members = set()
+
+    def push(self, item):
+        """
+        Appends an item to the back of the queue
+        :param item: The item to insert
+        """
+
+        self.items.append(item)
+        self.members.add(item)
+
+    def pop(self):
+        """
+        Removes and returns the next item, from the front in FIFO mode and from the back in LIFO mode
+        :return: The next item
+        """
+
+        item = self.items.pop() if self.lifo else self.items.popleft()
+        self.members.discard(item)
+        return item
+
+    def __contains__(self, item):
+        return item in self.members
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+class CombinedView(object):
+    """
+    Read-only view over several collections, used to report the frontiers of a
+    multi-directional search as a single open or closed set
+    """
+
+    def __init__(self, *collections):
+        """
+        Constructor
+        :param collections: The collections to combine
+        """
+
+        self.collections = collections
+
+    def __contains__(self, item):
+        return any(item in collection for collection in self.collections)
+
+    def __len__(self):
+        return sum(len(collection) for collection in self.collections)
+
+    def __iter__(self):
+        for collection in self.collections:
+            yield from collection
+
+
 class Graph(object):
     """
     Jazzing the graph since 1985
@@ -87,21 +290,341 @@ class Graph(object):
             return node_cache.values(), edge_set
 
 
+class BitDomain(object):
+    """
+    An immutable domain stored as an integer bitmask over a fixed tuple of values. Domains created from
+    the same universe share its values tuple and index map, so intersections and emptiness checks are
+    single integer operations. Iterating, len and membership behave like a set of the values
+    """
+
+    __slots__ = ('mask', 'values', 'index', 'size')
+
+    def __init__(self, mask, values, index):
+        """
+        Constructor
+        :param mask: Bitmask with bit i set if values[i] is in the domain
+        :param values: Tuple of all values this domain can hold
+        :param index: Dict mapping from value to its bit position in values
+        """
+
+        self.mask = mask
+        self.values = values
+        self.index = index
+        self.size = bin(mask).count('1')
+
+    @staticmethod
+    def from_domains(domains):
+        """
+        Converts a dict of domains to bitset domains. Nodes with equal initial domains share a universe
+        :param domains: Dict mapping from node to an iterable of values
+        :return: Dict mapping from node to BitDomain
+        """
+
+        universes = {}
+        converted = {}
+        for node, domain in domains.items():
+            key = frozenset(domain)
+            if key not in universes:
+                values = tuple(domain)
+                universes[key] = (values, {value: i for i, value in enumerate(values)})
+            values, index = universes[key]
+            converted[node] = BitDomain((1 << len(values)) - 1, values, index)
+
+        return converted
+
+    def derive(self, mask):
+        """
+        Creates a domain over the same universe with the given mask
+        """
+
+        return BitDomain(mask, self.values, self.index)
+
+    def only(self, value):
+        """
+        Creates a domain over the same universe holding only the given value
+        """
+
+        return BitDomain(1 << self.index[value], self.values, self.index)
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.mask != 0
+
+    def __iter__(self):
+        mask = self.mask
+        while mask:
+            low = mask & -mask
+            yield self.values[low.bit_length() - 1]
+            mask ^= low
+
+    def __contains__(self, value):
+        i = self.index.get(value)
+        return i is not None and bool(self.mask >> i & 1)
+
+    def __eq__(self, other):
+        if isinstance(other, BitDomain) and other.values is self.values:
+            return self.mask == other.mask
+        try:
+            return set(self) == set(other)
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'BitDomain(%s)' % set(self)
+
+
+DOMAIN_BACKENDS = {
+    'set': dict,
+    'bitset': BitDomain.from_domains,
+}
+
+
+class DomainCodec(object):
+    """
+    Encodes domains compactly as integer bitmasks over a fixed set of root domains, so that states can be sent
+    between processes without pickling every value. Decoded domains have the type of the root domain
+    """
+
+    def __init__(self, domains):
+        """
+        Constructor
+        :param domains: Dict mapping from node to root domain. Encoded domains must be subsets of these.
+        The domains of nodes with implicit root domains (see CSPState) are not encoded, but sent as they are
+        """
+
+        self.roots = dict(domains)
+        self.values = {}
+        self.index = {}
+        for node, domain in self.roots.items():
+            if not isinstance(domain, BitDomain) and not hasattr(domain, 'domain_hash'):
+                self.values[node] = tuple(domain)
+                self.index[node] = {value: i for i, value in enumerate(self.values[node])}
+
+    def encode(self, node, domain):
+        """
+        :return: The bitmask of the domain of the given node
+        """
+
+        if isinstance(domain, BitDomain):
+            return domain.mask
+        index = self.index.get(node)
+        if index is None:
+            return domain
+        mask = 0
+        for value in domain:
+            mask |= 1 << index[value]
+        return mask
+
+    def decode(self, node, mask):
+        """
+        :return: The domain of the given node described by the bitmask
+        """
+
+        root = self.roots[node]
+        if isinstance(root, BitDomain):
+            return root.derive(mask)
+        values = self.values.get(node)
+        if values is None:
+            return mask
+        selected = []
+        while mask:
+            low = mask & -mask
+            selected.append(values[low.bit_length() - 1])
+            mask ^= low
+        return set(selected) if isinstance(root, (set, frozenset)) else selected
+
+    def encode_all(self, domains):
+        return {node: self.encode(node, domain) for node, domain in domains.items()}
+
+    def decode_all(self, masks):
+        return {node: self.decode(node, mask) for node, mask in masks.items()}
+
+
 class CSPState(object):
     """
     This class represent a state in a GAC problem, and contains
     only the current domain sets for all the nodes in the problem.
 
-    A contradiction flag can be set during iteration
+    A contradiction flag can be set during iteration, and the total size of all domains is kept up to date
+
+    Every state also keeps a Zobrist style hash of its domains: the XOR of hash((node, value)) over every value
+    left in every domain. It is updated with the values added or removed by each set_domain, so states with the
+    same domains have the same hash regardless of the order the domains were reduced in
+
+    States forked from each other share a single DomainStore. Each state only records the domains it changed
+    relative to its parent, and accessing the nodes of a state checks it out in the store by undoing and
+    replaying changes along the path between the states. Domains must therefore never be mutated in place,
+    use set_domain to replace them. For the same reason a state can only be rolled back before it is forked,
+    since its children replay their changes on top of its own.
+
+    Domains are kept as given by default, or converted to BitDomains with the bitset backend.
+    Domains can also be implicit, describing their values without holding them. Such domains provide
+    domain_hash(node), used as their part of the hash instead of hashing every value, and only(value),
+    used by assign to reduce them. The same values must always be described by the same implicit domain
     """
 
-    def __init__(self, nodes={}):
+    def __init__(self, nodes={}, parent=None, backend='set'):
         """
         Constructor, takes in dict mapping from node to domain set
+        :param nodes: Dict mapping from node to domain, only used for root states
+        :param parent: The state this state is forked from
+        :param backend: Domain representation for root states, one of DOMAIN_BACKENDS
         """
 
-        self.nodes = nodes
+        self.parent = parent
+        self.changes = []
         self.contradiction = False
+        self.forks = 0
+
+        if parent is None:
+            self.depth = 0
+            self.store = DomainStore(DOMAIN_BACKENDS[backend](nodes), self)
+            self.size = sum(len(domain) for domain in self.store.domains.values())
+            self.hash = 0
+            for node, domain in self.store.domains.items():
+                self.hash ^= CSPState.domain_hash(node, domain)
+        else:
+            self.depth = parent.depth + 1
+            self.store = parent.store
+            self.size = parent.size
+            self.hash = parent.hash
+
+    @staticmethod
+    def domain_hash(node, values):
+        """
+        XORs together the hashes of the (node, value) pairs of the given values, or hashes an implicit domain
+        """
+
+        if hasattr(values, 'domain_hash'):
+            return values.domain_hash(node)
+        h = 0
+        for value in values:
+            h ^= hash((node, value))
+        return h
+
+    @property
+    def nodes(self):
+        """
+        The domains of this state. The returned dict is shared by all states forked from the same root,
+        and only reflects this state until another state is checked out
+        """
+
+        if self.store.current is not self:
+            self.store.checkout(self)
+        return self.store.domains
+
+    def set_domain(self, node, domain):
+        """
+        Replaces the domain of a node in this state, recording the change
+        :param node: The node to change the domain of
+        :param domain: The new domain
+        """
+
+        domains = self.nodes
+        old = domains[node]
+        self.changes.append((node, old, domain))
+        self.size += len(domain) - len(old)
+        if hasattr(old, 'domain_hash') or hasattr(domain, 'domain_hash'):
+            self.hash ^= CSPState.domain_hash(node, old) ^ CSPState.domain_hash(node, domain)
+        else:
+            if isinstance(old, BitDomain):
+                changed = old.derive(old.mask ^ domain.mask)
+            elif isinstance(old, (set, frozenset)):
+                changed = old.symmetric_difference(domain)
+            else:
+                changed = set(old).symmetric_difference(domain)
+            self.hash ^= CSPState.domain_hash(node, changed)
+        domains[node] = domain
+
+    def assign(self, node, value):
+        """
+        Reduces the domain of a node to a single value, keeping the representation of the domain
+        :param node: The node to assign
+        :param value: The value to assign to the node
+        """
+
+        domain = self.nodes[node]
+        if hasattr(domain, 'only'):
+            domain = domain.only(value)
+        elif isinstance(domain, (set, frozenset)):
+            domain = {value}
+        else:
+            domain = [value]
+        self.set_domain(node, domain)
+
+    def fork(self):
+        """
+        Creates a child state, initially with the same domains as this state
+        :return: The child state, checked out in the store
+        """
+
+        self.store.checkout(self)
+        child = CSPState(parent=self)
+        self.forks += 1
+        self.store.current = child
+        return child
+
+    def rollback(self):
+        """
+        Undoes the changes made by this state, checking out its parent instead
+        :raises Exception: If the state is a root state, or has been forked
+        """
+
+        if self.parent is None:
+            raise Exception('Cannot roll back a root state')
+        if self.forks:
+            raise Exception('Cannot roll back a state that has been forked')
+        self.store.checkout(self)
+        self.store.undo(self)
+        self.store.current = self.parent
+        self.changes = []
+        self.size = self.parent.size
+        self.hash = self.parent.hash
+
+
+class DomainStore(object):
+    """
+    A single materialized set of domains shared by a tree of CSPStates, positioned at one of them at a time
+    """
+
+    def __init__(self, domains, current):
+        self.domains = domains
+        self.current = current
+
+    def undo(self, state):
+        for node, old, new in reversed(state.changes):
+            self.domains[node] = old
+
+    def redo(self, state):
+        for node, old, new in state.changes:
+            self.domains[node] = new
+
+    def checkout(self, state):
+        """
+        Moves the store to the given state, undoing changes up to the common ancestor and replaying
+        the changes down to the state
+        """
+
+        current, target, replay = self.current, state, []
+        while current is not target:
+            if current.depth >= target.depth:
+                self.undo(current)
+                current = current.parent
+            else:
+                replay.append(target)
+                target = target.parent
+
+        for target in reversed(replay):
+            self.redo(target)
+
+        self.current = state
 
 
 class AStarState(Node):
@@ -110,6 +633,10 @@ class AStarState(Node):
     as well as F, G and H values.
     """
 
+    __slots__ = ('is_start', 'is_goal', 'state', 'arc_cost', 'g', 'h', 'f', 'walkable')
+
+    full_repr_mode = True
+
     def __init__(self, index=None, x=None, y=None):
         super(AStarState, self).__init__(index=index, x=x, y=y)
         self.is_start = None
@@ -120,7 +647,6 @@ class AStarState(Node):
         self.h = 0
         self.f = 0
         self.walkable = True
-        self.full_repr_mode = True
 
     def __lt__(self, other):
         if self.f == other.f:
@@ -137,3 +663,284 @@ class AStarState(Node):
             return 'A*Node(%d, %d, F: %d, G: %d, H: %d)' % (self.x, self.y, self.f, self.g, self.h)
         else:
             return 'A*Node(%d (%d, %d))' % (self.index, self.x, self.y)
+
+
+class CSPNode(AStarState):
+    """
+    An A* node wrapping a CSPState. Nodes are identified by the domains of their state, so the same domain
+    configuration reached through different assignment orders is detected as a duplicate by the open and
+    closed sets of A*
+    """
+
+    __slots__ = ()
+
+    def __init__(self, state=None):
+        super(CSPNode, self).__init__()
+        self.state = state
+
+    def __hash__(self):
+        return self.state.hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, CSPNode) or self.state.hash != other.state.hash:
+            return False
+        return dict(self.state.nodes) == other.state.nodes
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'CSPNode(%x, F: %d, G: %d, H: %d)' % (self.state.hash & 0xffffffff, self.f, self.g, self.h)
+
+
+class GridCell(object):
+    """
+    Lightweight A* state for a cell in a CompactGrid. All per-cell values live in the grid's arrays,
+    so the cell object only holds its coordinates and is created when a search first touches the cell.
+    """
+
+    __slots__ = ('grid', 'index', 'x', 'y', '_children')
+
+    full_repr_mode = True
+
+    def __init__(self, grid, x, y):
+        self.grid = grid
+        self.index = y * grid.width + x
+        self.x = x
+        self.y = y
+        self._children = None
+
+    @property
+    def children(self):
+        if self._children is None:
+            self._children = set()
+        return self._children
+
+    @property
+    def g(self):
+        return self.grid.g[self.index]
+
+    @g.setter
+    def g(self, value):
+        self.grid.g[self.index] = value
+
+    @property
+    def h(self):
+        return self.grid.h[self.index]
+
+    @h.setter
+    def h(self, value):
+        self.grid.h[self.index] = value
+
+    @property
+    def f(self):
+        return self.grid.f[self.index]
+
+    @f.setter
+    def f(self, value):
+        self.grid.f[self.index] = value
+
+    @property
+    def parent(self):
+        index = self.grid.parent[self.index]
+        return None if index < 0 else self.grid.cell(index % self.grid.width, index // self.grid.width)
+
+    @parent.setter
+    def parent(self, node):
+        self.grid.parent[self.index] = -1 if node is None else node.index
+
+    @property
+    def walkable(self):
+        return bool(self.grid.walkable[self.index])
+
+    @walkable.setter
+    def walkable(self, value):
+        # The walkability byte doubles as the arc cost, so a walkable byte is kept as it is, and the cost of a
+        # cell being blocked is moved to arc_costs to survive unblocking it again
+        cost = self.grid.walkable[self.index]
+        if value and not cost:
+            self.grid.walkable[self.index] = 1
+        elif not value and cost:
+            if cost > 1:
+                self.grid.arc_costs.setdefault(self.index, cost)
+            self.grid.walkable[self.index] = 0
+
+    @property
+    def arc_cost(self):
+        cost = self.grid.arc_costs.get(self.index)
+        return cost if cost is not None else self.grid.walkable[self.index] or 1
+
+    @arc_cost.setter
+    def arc_cost(self, value):
+        self.grid.arc_costs[self.index] = value
+
+    @property
+    def is_start(self):
+        return self.index == self.grid.start
+
+    @property
+    def is_goal(self):
+        return self.index == self.grid.goal
+
+    def __lt__(self, other):
+        if self.f == other.f:
+            return self.h < other.h
+        return self.f < other.f
+
+    def __gt__(self, other):
+        if self.f == other.f:
+            return self.h > other.h
+        return self.f > other.f
+
+    def __repr__(self):
+        if self.full_repr_mode:
+            return 'A*Node(%d, %d, F: %d, G: %d, H: %d)' % (self.x, self.y, self.f, self.g, self.h)
+        else:
+            return 'A*Node(%d (%d, %d))' % (self.index, self.x, self.y)
+
+
+class CompactGrid(object):
+    """
+    Array backed grid storing walkability, g, h, f and parent as flat columns indexed by cell id (y * width + x).
+    Cells are materialized as GridCell objects on first access and cached, so only the cells a search
+    touches cost more than a few bytes. Indexing with grid[y][x] is supported for the renderers.
+    """
+
+    def __init__(self, width, height, walkable=None):
+        """
+        Constructor
+        :param width: Number of columns
+        :param height: Number of rows
+        :param walkable: Optional buffer of one byte per cell to use as the walkability column without copying,
+        0 for obstacles and the arc cost for walkable cells. Defaults to a new buffer with every cell walkable
+        """
+
+        size = width * height
+        self.width = width
+        self.height = height
+        self.walkable = bytearray(b'\x01') * size if walkable is None else walkable
+        self.g = array('d', [0.0]) * size
+        self.h = array('d', [0.0]) * size
+        self.f = array('d', [0.0]) * size
+        self.parent = array('i', [-1]) * size
+        self.arc_costs = {}
+        self.cells = {}
+        self.start = -1
+        self.goal = -1
+
+    def cell(self, x, y):
+        """
+        Returns the cell at the given coordinates, creating it on first access
+        """
+
+        index = y * self.width + x
+        cell = self.cells.get(index)
+        if cell is None:
+            cell = self.cells[index] = GridCell(self, x, y)
+        return cell
+
+    def is_walkable(self, x, y):
+        """
+        Checks whether a cell is inside the grid and walkable, without materializing it
+        """
+
+        return 0 <= x < self.width and 0 <= y < self.height and self.walkable[y * self.width + x] != 0
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, y):
+        return NodeRow(self, y)
+
+    def __iter__(self):
+        return (NodeRow(self, y) for y in range(self.height))
+
+    # Same accessor as NodeGrid, for NodeRow
+    node = cell
+
+
+class NodeGrid(object):
+    """
+    Grid of AStarState objects derived on demand from a flat buffer of one byte per cell (y * width + x),
+    0 for obstacles and the arc cost for walkable cells. Nodes are created on first access and cached, after which
+    the node is authoritative for walkability and arc cost. Indexing with grid[y][x] is supported for the renderers.
+    """
+
+    def __init__(self, width, height, costs):
+        """
+        Constructor
+        :param width: Number of columns
+        :param height: Number of rows
+        :param costs: Buffer of width * height cell bytes, used without copying
+        """
+
+        self.width = width
+        self.height = height
+        self.costs = costs
+        self.nodes = {}
+
+    def node(self, x, y):
+        """
+        Returns the node at the given coordinates, creating it on first access
+        """
+
+        index = y * self.width + x
+        node = self.nodes.get(index)
+        if node is None:
+            node = self.nodes[index] = AStarState(index=index, x=x, y=y)
+            cost = self.costs[index]
+            if cost == 0:
+                node.walkable = False
+            elif cost > 1:
+                node.arc_cost = cost
+        return node
+
+    def is_walkable(self, x, y):
+        """
+        Checks whether a cell is inside the grid and walkable, without creating its node
+        """
+
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return False
+        index = y * self.width + x
+        node = self.nodes.get(index)
+        return node.walkable if node is not None else self.costs[index] != 0
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, y):
+        return NodeRow(self, y)
+
+    def __iter__(self):
+        return (NodeRow(self, y) for y in range(self.height))
+
+
+class NodeRow(object):
+    """
+    A row of a NodeGrid or CompactGrid, creating the nodes it is indexed with
+    """
+
+    __slots__ = ('grid', 'y')
+
+    def __init__(self, grid, y):
+        self.grid = grid
+        self.y = y
+
+    def __len__(self):
+        return self.grid.width
+
+    def __getitem__(self, x):
+        if x < 0:
+            x += self.grid.width
+        if not 0 <= x < self.grid.width:
+            raise IndexError('row index out of range')
+        return self.grid.node(x, self.y)
+
+    def __iter__(self):
+        return (self.grid.node(x, self.y) for x in range(self.grid.width))
+
+    def __repr__(self):
+        return repr(list(self))
@@ -145,8 +145,10 @@ class CanvasRenderer(AbstractRenderer):
 
         if 'nonogram' in kwargs and kwargs['nonogram'] is not None:
             p = kwargs['nonogram']
+            domains = path[0].state.nodes
             for y in range(p.total_rows):
-                for x in range(len(p.nodes[y][0][1])):
+                cells = p.drawn_cells(domains[y])
+                for x in range(p.total_cols):
                     coords = (
                         x * BOARD_CELL_SIZE + 1,
                         y * BOARD_CELL_SIZE + 1,
@@ -156,7 +158,7 @@ class CanvasRenderer(AbstractRenderer):
 
                     fill_color = '#FFFFFF'
 
-                    if p.nodes[y][0][1][x]:
+                    if cells >> x & 1:
                         fill_color = '#22EE22'
 
                     # Create sprite and add to path sprite cache
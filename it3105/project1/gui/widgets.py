@@ -6,6 +6,8 @@ from tkinter import *
 
 from algorithms import ASTAR_OPTIONS, ASTAR_HEURISTIC, GAC_DEFAULT_K, GAC_DEFAULT_CONSTRAINT
 from common import *
+from datastructures import DOMAIN_BACKENDS
+from module2.vc import VARIABLE_ORDERS, VALUE_ORDERS
 
 
 def generate_menus(window):
@@ -105,6 +107,30 @@ def generate_options(frame, module=1):
         constraint_formula.grid(row=4, column=1, padx=5, pady=5, ipadx=5, ipady=5, sticky='E')
         frame.master.controller.references['constraint_formula'] = constraint_formula
 
+        variable_order_label = Label(frame, text='Variable order:')
+        variable_order_label.grid(row=5, padx=5, pady=5, ipadx=5, ipady=5, sticky='W')
+
+        variable_order_var = StringVar(master=frame, value=VARIABLE_ORDERS[1], name='variable_order')
+        frame.master.controller.references['variable_order'] = variable_order_var
+        variable_order_options = OptionMenu(frame, variable_order_var, *VARIABLE_ORDERS)
+        variable_order_options.grid(row=5, column=1, sticky='E')
+
+        value_order_label = Label(frame, text='Value order:')
+        value_order_label.grid(row=6, padx=5, pady=5, ipadx=5, ipady=5, sticky='W')
+
+        value_order_var = StringVar(master=frame, value=VALUE_ORDERS[0], name='value_order')
+        frame.master.controller.references['value_order'] = value_order_var
+        value_order_options = OptionMenu(frame, value_order_var, *VALUE_ORDERS)
+        value_order_options.grid(row=6, column=1, sticky='E')
+
+        backend_label = Label(frame, text='Domains:')
+        backend_label.grid(row=7, padx=5, pady=5, ipadx=5, ipady=5, sticky='W')
+
+        backend_var = StringVar(master=frame, value='bitset', name='backend')
+        frame.master.controller.references['backend'] = backend_var
+        backend_options = OptionMenu(frame, backend_var, *sorted(DOMAIN_BACKENDS))
+        backend_options.grid(row=7, column=1, sticky='E')
+
 
 def generate_stats(frame, module=1):
     """
@@ -151,3 +177,9 @@ def generate_stats(frame, module=1):
         total_missing_assignment_label = Label(frame, textvariable=total_missing_assignment)
         frame.master.controller.references['total_missing_assignment'] = total_missing_assignment
         total_missing_assignment_label.grid(row=5, padx=5, pady=5, ipadx=5, ipady=5, sticky='W')
+
+        failed_assignments = StringVar(frame)
+        failed_assignments.set('Failed assignments: 0 (0 branches)')
+        failed_assignments_label = Label(frame, textvariable=failed_assignments)
+        frame.master.controller.references['failed_assignments'] = failed_assignments
+        failed_assignments_label.grid(row=6, padx=5, pady=5, ipadx=5, ipady=5, sticky='W')
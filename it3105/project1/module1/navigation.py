@@ -2,9 +2,289 @@
 #
 # Created by 'hakloev' on 9/10/15
 
-from algorithms import AStarProblem
-from datastructures import AStarState
+from algorithms import AStarProblem, GACPool
+from collections import deque
+from common import log
+from datastructures import CompactGrid, NodeGrid
 from math import pow, sqrt
+import heapq
+import multiprocessing
+import numpy as np
+import os
+import struct
+import tempfile
+
+# Distance measures available as heuristics, as scalar functions of two nodes, as scalar functions of
+# coordinate offsets and as vectorized functions of coordinate offset arrays
+DISTANCES = {
+    'manhattan': lambda node, target: abs(node.x - target.x) + abs(node.y - target.y),
+    'euclidean': lambda node, target: sqrt(pow((node.x - target.x), 2) + pow((node.y - target.y), 2))
+}
+DISTANCE_OFFSETS = {
+    'manhattan': lambda dx, dy: abs(dx) + abs(dy),
+    'euclidean': lambda dx, dy: sqrt(dx * dx + dy * dy)
+}
+DISTANCE_ARRAYS = {
+    'manhattan': lambda dx, dy: np.abs(dx) + np.abs(dy),
+    'euclidean': lambda dx, dy: np.sqrt(dx * dx + dy * dy)
+}
+
+# Binary board format: a little endian header with magic, version, reserved field, width, height and start and
+# goal coordinates, followed by one byte per cell in row major order (y * width + x). A zero byte is an obstacle,
+# any other value is a walkable cell with that arc cost
+BINARY_BOARD_MAGIC = b'NAVB'
+BINARY_BOARD_VERSION = 1
+BINARY_BOARD_HEADER = struct.Struct('<4sHHIIIIII')
+BINARY_BOARD_SUFFIX = '.navb'
+
+# Landmark (ALT) heuristic: exact distances from and to a few landmark cells, persisted in a directory next to
+# the board, so the board directories only list boards
+LANDMARK_DIR = '.landmarks'
+DEFAULT_LANDMARKS = 8
+
+
+def read_text_board(board_path):
+    """
+    Parses a board in the module1 text format into a cost array
+    :param board_path: Path to the text board
+    :return: Tuple of the start and goal coordinates and a (height, width) uint8 array, 0 for obstacles
+    :raises IndexError: If an obstacle does not lie within the board
+    """
+
+    with open(board_path) as f:
+        width, height = map(int, f.readline().split())
+        sx, sy, gx, gy = map(int, f.readline().split())
+        cells = np.ones((height, width), dtype=np.uint8)
+        for line in f:
+            if line.strip():
+                ox, oy, ow, oh = map(int, line.split())
+                if ox < 0 or oy < 0 or ox + ow > width or oy + oh > height:
+                    raise IndexError('Obstacle (%d, %d, %d, %d) is outside the %dx%d board' % (
+                        ox, oy, ow, oh, width, height
+                    ))
+                cells[oy:oy + oh, ox:ox + ow] = 0
+
+    return (sx, sy), (gx, gy), cells
+
+
+def convert_board(board_path, binary_path=None):
+    """
+    Converts a board in the module1 text format to the binary board format
+    :param board_path: Path to the text board
+    :param binary_path: Path to write the binary board to, defaults to the text path with the binary suffix
+    :return: The path of the binary board
+    """
+
+    if binary_path is None:
+        binary_path = os.path.splitext(board_path)[0] + BINARY_BOARD_SUFFIX
+
+    (sx, sy), (gx, gy), cells = read_text_board(board_path)
+    height, width = cells.shape
+    with open(binary_path, 'wb') as f:
+        f.write(BINARY_BOARD_HEADER.pack(BINARY_BOARD_MAGIC, BINARY_BOARD_VERSION, 0, width, height, sx, sy, gx, gy))
+        f.write(cells.tobytes())
+
+    return binary_path
+
+
+def load_binary_board(binary_path, mode='r'):
+    """
+    Maps a binary board into memory without copying it. Read only maps can be shared between processes
+    :param binary_path: Path to the binary board
+    :param mode: numpy.memmap mode, 'r' for read only, 'c' for copy on write or 'r+' to write through to the file
+    :return: Tuple of the start and goal coordinates and a (height, width) uint8 memmap of cell costs
+    """
+
+    with open(binary_path, 'rb') as f:
+        header = f.read(BINARY_BOARD_HEADER.size)
+    if len(header) < BINARY_BOARD_HEADER.size:
+        raise Exception('%s is too short to be a binary board' % binary_path)
+    magic, version, reserved, width, height, sx, sy, gx, gy = BINARY_BOARD_HEADER.unpack(header)
+    if magic != BINARY_BOARD_MAGIC or version != BINARY_BOARD_VERSION:
+        raise Exception('%s is not a version %d binary board' % (binary_path, BINARY_BOARD_VERSION))
+
+    cells = np.memmap(binary_path, dtype=np.uint8, mode=mode, offset=BINARY_BOARD_HEADER.size, shape=(height, width))
+    return (sx, sy), (gx, gy), cells
+
+
+def cell_distances(cells, source, reverse=False):
+    """
+    Computes the exact distances between a cell and every cell of a rasterized board, with a breadth first search
+    when every walkable cell costs 1 and Dijkstra's algorithm otherwise. Moving out of a cell costs its arc cost
+    :param cells: (height, width) uint8 array, 0 for obstacles and the arc cost for walkable cells
+    :param source: Cell id of the source cell, y * width + x
+    :param reverse: Whether to compute the distances to the source instead of from it
+    :return: Flat float array of distances indexed by cell id, inf for unreachable cells
+    """
+
+    height, width = cells.shape
+    costs = memoryview(np.ascontiguousarray(cells).reshape(-1))
+    distances = np.full(height * width, np.inf)
+
+    def neighbours(index):
+        x = index % width
+        if x < width - 1 and costs[index + 1]:
+            yield index + 1
+        if index >= width and costs[index - width]:
+            yield index - width
+        if x > 0 and costs[index - 1]:
+            yield index - 1
+        if index < (height - 1) * width and costs[index + width]:
+            yield index + width
+
+    if cells.max() <= 1:
+        found = {source: 0}
+        queue = deque([source])
+        while queue:
+            index = queue.popleft()
+            distance = found[index] + 1
+            for neighbour in neighbours(index):
+                if neighbour not in found:
+                    found[neighbour] = distance
+                    queue.append(neighbour)
+    else:
+        found = {}
+        tentative = {source: 0}
+        queue = [(0, source)]
+        while queue:
+            distance, index = heapq.heappop(queue)
+            if index in found:
+                continue
+            found[index] = distance
+            for neighbour in neighbours(index):
+                cost = distance + (costs[neighbour] if reverse else costs[index])
+                if neighbour not in found and cost < tentative.get(neighbour, cost + 1):
+                    tentative[neighbour] = cost
+                    heapq.heappush(queue, (cost, neighbour))
+
+    distances[list(found)] = list(found.values())
+    return distances
+
+
+def compute_landmarks(cells, count=DEFAULT_LANDMARKS, seed=None):
+    """
+    Picks landmarks by farthest point selection, each new landmark being the reachable cell farthest from the
+    landmarks chosen so far, and computes the distances from and to each of them
+    :param cells: (height, width) uint8 array, 0 for obstacles and the arc cost for walkable cells
+    :param count: Number of landmarks
+    :param seed: Cell id to start the selection from, defaults to the first walkable cell
+    :return: Tuple of an array of landmark cell ids and (height * width, count) arrays of the distances
+    from and to each landmark, with one row per cell
+    """
+
+    walkable = np.flatnonzero(cells)
+    if not len(walkable):
+        return np.zeros(0, dtype=np.int64), np.zeros((cells.size, 0)), np.zeros((cells.size, 0))
+    uniform = cells.max() <= 1
+
+    landmarks, distances_from, distances_to = [], [], []
+    nearest = cell_distances(cells, int(walkable[0]) if seed is None else seed)
+    for _ in range(count):
+        reachable = np.where(np.isfinite(nearest), nearest, -1)
+        landmark = int(np.argmax(reachable))
+        if landmark in landmarks:
+            break
+        landmarks.append(landmark)
+        distances_from.append(cell_distances(cells, landmark))
+        distances_to.append(distances_from[-1] if uniform else cell_distances(cells, landmark, reverse=True))
+        nearest = distances_from[-1] if len(landmarks) == 1 else np.minimum(nearest, distances_from[-1])
+
+    return (
+        np.array(landmarks, dtype=np.int64),
+        np.ascontiguousarray(np.transpose(distances_from)),
+        np.ascontiguousarray(np.transpose(distances_to))
+    )
+
+
+def load_landmarks(board_path, cells, count=DEFAULT_LANDMARKS):
+    """
+    Loads the landmark distances persisted next to a board, computing and saving them first if they are missing,
+    older than the board or computed for another board size or landmark count. If the board directory is not
+    writable, the computed distances are returned without saving them
+    :param board_path: Path to the board file
+    :param cells: (height, width) uint8 array of the board
+    :param count: Number of landmarks
+    :return: Tuple of landmark cell ids, distances from and distances to the landmarks, as from compute_landmarks
+    """
+
+    path = os.path.join(os.path.dirname(board_path), LANDMARK_DIR, os.path.basename(board_path) + '.npz')
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(board_path):
+        with np.load(path) as data:
+            landmarks = data['landmarks'], data['distances_from'], data['distances_to']
+            saved_count = int(data['count'])
+        if landmarks[1].shape[0] == cells.size and saved_count == count:
+            return landmarks
+
+    landmarks = compute_landmarks(cells, count)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    except OSError:
+        # The board directory is read only, so the distances are only kept in memory
+        return landmarks
+
+    # Other processes sharing the board may load the file at any time, so it is moved into place once complete
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, count=count, landmarks=landmarks[0], distances_from=landmarks[1], distances_to=landmarks[2])
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+    return landmarks
+
+
+def landmark_bound(landmarks, index, target):
+    """
+    Lower bound on the distance from cells to a target cell by the triangle inequality over every landmark L:
+    d(v, t) >= d(v, L) - d(t, L) and d(v, t) >= d(L, t) - d(L, v). Terms with unreachable cells are skipped
+    :param landmarks: Tuple of landmark cell ids, distances from and distances to the landmarks
+    :param index: Cell id, or a slice or array of cell ids
+    :param target: Cell id of the target
+    :return: The bound, or an array of bounds if index selects several cells
+    """
+
+    _, distances_from, distances_to = landmarks
+    with np.errstate(invalid='ignore'):
+        bounds = np.maximum(
+            distances_to[index] - distances_to[target],
+            distances_from[target] - distances_from[index]
+        )
+    bounds[~np.isfinite(bounds)] = 0
+    return np.maximum(bounds.max(axis=-1, initial=0), 0)
+
+
+def landmark_estimator(landmarks, target, reverse=False):
+    """
+    Returns a function computing landmark_bound for single cells and a fixed target. It works on Python floats,
+    which is several times faster than numpy for the handful of landmarks compared per cell.
+    Arc costs are directed, so the reverse estimator bounds d(t, v) with d(t, L) - d(v, L) and d(L, v) - d(L, t)
+    instead, which is the forward bound with the distances from and to the landmarks swapped
+    :param landmarks: Tuple of landmark cell ids, distances from and distances to the landmarks
+    :param target: Cell id of the target
+    :param reverse: Whether to bound the distance from the target to the cells instead of to the target
+    """
+
+    _, distances_from, distances_to = landmarks
+    if reverse:
+        distances_from, distances_to = distances_to, distances_from
+    target_to, target_from = distances_to[target].tolist(), distances_from[target].tolist()
+    infinity = float('inf')
+
+    def estimate(index):
+        bound = 0.0
+        for cell_to, cell_from, to, from_ in zip(
+                distances_to[index].tolist(), distances_from[index].tolist(), target_to, target_from):
+            # inf - inf is nan and finite - inf is -inf, neither of which compares greater than the bound
+            difference = cell_to - to
+            if bound < difference != infinity:
+                bound = difference
+            difference = from_ - cell_from
+            if bound < difference != infinity:
+                bound = difference
+        return bound
+
+    return estimate
 
 
 class NavigationProblem(AStarProblem):
@@ -19,12 +299,15 @@ class NavigationProblem(AStarProblem):
         """
 
         self.board_path = board_path
-        self.mode = mode
         self.grid = None
+        self.landmarks = None
         self.start_node = None
         self.goal_node = None
+        self.mode = mode
 
-        if board_path:
+        if board_path and board_path.endswith(BINARY_BOARD_SUFFIX):
+            self.init_grid_from_binary()
+        elif board_path:
             self.init_grid_from_file()
         else:
             self.grid = [[]]
@@ -33,49 +316,121 @@ class NavigationProblem(AStarProblem):
         """
         Reads and parses all the data from the text file representing the board
         """
-        with open(self.board_path) as f:
-            width, height = map(int, f.readline().split())
-            self.grid = [[AStarState(index=(y*x+x), x=x, y=y) for x in range(width)] for y in range(height)]
-            sx, sy, gx, gy = map(int, f.readline().split())
-            self.start_node = self.get_node(sx, sy)
-            self.start_node.is_start = True
-            self.goal_node = self.get_node(gx, gy)
-            self.goal_node.is_goal = True
+        self.init_grid_from_cells(*read_text_board(self.board_path))
 
-            for line in f.readlines():
-                ox, oy, ow, oh = map(int, line.split())
-                for y in range(oh):
-                    for x in range(ow):
-                        obstacle_node = self.get_node(ox + x, oy + y)
-                        obstacle_node.walkable = False
+    def init_grid_from_binary(self):
+        """
+        Reads the board from a file in the binary board format
+        """
+        self.init_grid_from_cells(*load_binary_board(self.board_path, mode='c'))
+
+    def init_grid_from_cells(self, start, goal, cells):
+        """
+        Sets up the grid from a rasterized board. Node objects are only created for the cells that are accessed
+        :param start: Start coordinates
+        :param goal: Goal coordinates
+        :param cells: (height, width) uint8 array, 0 for obstacles and the arc cost for walkable cells
+        """
+        height, width = cells.shape
+        self.grid = NodeGrid(width, height, memoryview(cells.reshape(-1)))
+        self.start_node = self.get_node(*start)
+        self.start_node.is_start = True
+        self.goal_node = self.get_node(*goal)
+        self.goal_node.is_goal = True
 
     def get_all_successor_nodes(self, node):
         """
         Returns all adjacent nodes to the node parameter
         :param node: The node to find adjacent nodes to
         """
-        nodes = []
-        if node.x < len(self.grid[0]) - 1 and self.get_node(node.x + 1, node.y).walkable:
-            nodes.append(self.get_node(node.x + 1, node.y))
-        if node.y > 0 and self.get_node(node.x, node.y - 1).walkable:
-            nodes.append(self.get_node(node.x, node.y - 1))
-        if node.x > 0 and self.get_node(node.x - 1, node.y).walkable:
-            nodes.append(self.get_node(node.x - 1, node.y))
-        if node.y < len(self.grid) - 1 and self.get_node(node.x, node.y + 1).walkable:
-            nodes.append(self.get_node(node.x, node.y + 1))
+        x, y = node.x, node.y
+        return [
+            self.get_node(nx, ny) for nx, ny in ((x + 1, y), (x, y - 1), (x - 1, y), (x, y + 1))
+            if self.is_walkable(nx, ny)
+        ]
 
-        return nodes
+    @property
+    def mode(self):
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode):
+        """
+        Sets the heuristic mode, binding its distance function and clearing cached heuristic values
+        """
+
+        self._mode = mode
+        self.distance_function = self.landmark_distance if mode == 'landmarks' else DISTANCES[mode]
+        self.reset_heuristic()
+
+    def get_landmarks(self):
+        """
+        Returns the landmark distances of the board file, loading or computing them on first use.
+        The cells are read from the file again rather than taken from the grid, which set_cell may have
+        changed, so the persisted distances always describe the board itself. They are not updated by set_cell
+        """
+
+        if self.landmarks is None:
+            self.landmarks = load_landmarks(self.board_path, load_board(self.board_path)[2])
+        return self.landmarks
+
+    def landmark_distance(self, node, target, reverse=False):
+        """
+        Landmark (ALT) lower bound on the distance from a node to a target node, or from the target to the node
+        if reverse is set. One estimator is kept per target and direction, so the forward and reverse heuristics
+        of a bidirectional search each convert the target rows once
+        """
+
+        key = (target.index, reverse)
+        estimate = self.landmark_estimators.get(key)
+        if estimate is None:
+            estimate = self.landmark_estimators[key] = landmark_estimator(self.get_landmarks(), target.index, reverse)
+        return estimate(node.index)
+
+    def reset_heuristic(self):
+        """
+        Clears the cached heuristic values. Must be called if the goal node changes
+        """
+
+        self.heuristic_cache = {}
+        self.landmark_estimators = {}
+
+    def precompute_heuristic(self):
+        """
+        Computes the heuristic for every cell on the board in one vectorized pass, replacing the lazily
+        filled cache with a table indexed by cell id
+        """
+
+        if self.mode == 'landmarks':
+            table = landmark_bound(self.get_landmarks(), slice(None), self.goal_node.index)
+        else:
+            ys, xs = np.indices((self.grid.height, self.grid.width))
+            table = DISTANCE_ARRAYS[self.mode](xs - self.goal_node.x, ys - self.goal_node.y)
+        self.heuristic_cache = table.ravel().tolist()
 
     def heuristic(self, node):
         """
-        Heuristic function. Here implemented as Manhattan distance
+        Heuristic function, the distance to the goal node given by the current mode.
+        Values are cached per cell id, since A* asks for the same cells repeatedly
         :param node: The node to perform the heuristic function on
         """
 
-        return {
-            'manhattan': lambda: abs(node.x - self.goal_node.x) + abs(node.y - self.goal_node.y),
-            'euclidean': lambda: sqrt(pow((node.x - self.goal_node.x), 2) + pow((node.y - self.goal_node.y), 2))
-        }.get(self.mode)()
+        try:
+            return self.heuristic_cache[node.index]
+        except KeyError:
+            h = self.heuristic_cache[node.index] = self.distance_function(node, self.goal_node)
+            return h
+
+    def reverse_heuristic(self, node):
+        """
+        Heuristic function for searching backwards, estimating the distance from the start node. Arc costs
+        are directed, so the landmark bound has to be taken in the reverse direction
+        :param node: The node to perform the heuristic function on
+        """
+
+        if self.mode == 'landmarks':
+            return self.landmark_distance(node, self.start_node, reverse=True)
+        return self.distance_function(node, self.start_node)
 
     def arc_cost(self, node):
         """
@@ -92,7 +447,31 @@ class NavigationProblem(AStarProblem):
         :param y: Y coordinate
         :return: AStarNode instance
         """
-        return self.grid[y][x]
+        return self.grid.node(x, y)
+
+    def is_walkable(self, x, y):
+        """
+        Checks whether a cell is inside the board and walkable
+        :param x: X coordinate
+        :param y: Y coordinate
+        """
+        return self.grid.is_walkable(x, y)
+
+    def set_cell(self, x, y, walkable=None, arc_cost=None):
+        """
+        Changes the walkability and/or arc cost of a cell, for use with incremental planners like LPAStar
+        :param x: X coordinate
+        :param y: Y coordinate
+        :param walkable: The new walkable flag, or None to keep it
+        :param arc_cost: The new arc cost, or None to keep it
+        :return: The changed node
+        """
+        node = self.get_node(x, y)
+        if walkable is not None:
+            node.walkable = walkable
+        if arc_cost is not None:
+            node.arc_cost = arc_cost
+        return node
 
     def get_start_node(self):
         """
@@ -120,3 +499,307 @@ class NavigationProblem(AStarProblem):
         for row in reversed(self.grid):
             string += "%s\n" % repr(row)
         return string
+
+
+class JumpPointNavigationProblem(NavigationProblem):
+    """
+    NavigationProblem generating successors with Jump Point Search, for 4-connected grids with uniform arc cost.
+    Successors are the next jump points in each canonical direction instead of the adjacent cells,
+    which prunes the symmetric paths A* would otherwise expand. Paths returned by A* therefore only
+    contain jump points, use get_full_path to fill in the cells between them.
+
+    Paths are canonical in the sense that vertical moves never precede horizontal moves, unless an obstacle
+    forces the turn. A node reached horizontally continues horizontally or turns vertically, while a node
+    reached vertically continues vertically or turns to a forced neighbour.
+    """
+
+    def get_all_successor_nodes(self, node):
+        """
+        Returns the jump points reachable from the node, pruned by the direction the node was reached from
+        :param node: The node to find successors of
+        """
+        x, y = node.x, node.y
+        jumps = []
+        parent = node.parent
+
+        if parent is None or node.is_start:
+            jumps = [self.jump_horizontal(x, y, 1), self.jump_horizontal(x, y, -1),
+                     self.jump_vertical(x, y, 1), self.jump_vertical(x, y, -1)]
+        elif parent.y == y:
+            dx = 1 if x > parent.x else -1
+            jumps = [self.jump_horizontal(x, y, dx), self.jump_vertical(x, y, 1), self.jump_vertical(x, y, -1)]
+        else:
+            dy = 1 if y > parent.y else -1
+            jumps = [self.jump_vertical(x, y, dy)]
+            for dx in (1, -1):
+                if self.is_walkable(x + dx, y) and not self.is_walkable(x + dx, y - dy):
+                    jumps.append(self.jump_horizontal(x, y, dx))
+
+        return [jump for jump in jumps if jump is not None]
+
+    def jump_horizontal(self, x, y, dx):
+        """
+        Moves horizontally from a cell until reaching a jump point, which is the goal or a cell where
+        a vertical jump finds a jump point
+        :return: The jump point, or None if the move runs into an obstacle or the edge of the board
+        """
+        while True:
+            x += dx
+            if not self.is_walkable(x, y):
+                return None
+            node = self.get_node(x, y)
+            if node.is_goal or self.jump_vertical(x, y, 1) or self.jump_vertical(x, y, -1):
+                return node
+
+    def jump_vertical(self, x, y, dy):
+        """
+        Moves vertically from a cell until reaching a jump point, which is the goal or a cell with a forced
+        horizontal neighbour, i.e. a walkable cell beside it next to a blocked cell beside the previous one
+        :return: The jump point, or None if the move runs into an obstacle or the edge of the board
+        """
+        while True:
+            y += dy
+            if not self.is_walkable(x, y):
+                return None
+            node = self.get_node(x, y)
+            if node.is_goal:
+                return node
+            for dx in (1, -1):
+                if self.is_walkable(x + dx, y) and not self.is_walkable(x + dx, y - dy):
+                    return node
+
+    def edge_cost(self, node, successor):
+        """
+        Jump points lie on a straight line from their parent, so the cost is the number of cells moved
+        """
+        return abs(node.x - successor.x) + abs(node.y - successor.y)
+
+    def get_full_path(self, path):
+        """
+        Fills in the cells between consecutive jump points in a path
+        :param path: A path of jump points, as returned by A*
+        :return: The path with every cell on it
+        """
+        if not path:
+            return []
+
+        full_path = [path[0]]
+        for node in path[1:]:
+            last = full_path[-1]
+            dx = (node.x > last.x) - (node.x < last.x)
+            dy = (node.y > last.y) - (node.y < last.y)
+            for step in range(1, abs(node.x - last.x) + abs(node.y - last.y) + 1):
+                full_path.append(self.get_node(last.x + dx * step, last.y + dy * step))
+        return full_path
+
+
+class CompactNavigationProblem(NavigationProblem):
+    """
+    NavigationProblem backed by a CompactGrid, storing per-cell search values in flat arrays instead of one
+    AStarState per cell. Cell objects are only created for cells the search touches, which makes very large
+    boards fit in memory.
+    """
+
+    def init_grid_from_binary(self, mode='c'):
+        """
+        Maps the board from a file in the binary board format, using the mapped cells directly as the
+        walkability and cost column of the grid. Nothing is copied, pages are only read when the search
+        touches them
+        :param mode: numpy.memmap mode. The default copy on write map allows changing cells without
+        touching the file, 'r' maps the board read only so it can be shared with other processes
+        """
+        self.init_grid_from_cells(*load_binary_board(self.board_path, mode=mode))
+
+    def init_grid_from_cells(self, start, goal, cells):
+        """
+        Sets up the grid using the rasterized board directly as its walkability column
+        :param start: Start coordinates
+        :param goal: Goal coordinates
+        :param cells: (height, width) uint8 array, 0 for obstacles and the arc cost for walkable cells
+        """
+        (sx, sy), (gx, gy) = start, goal
+        height, width = cells.shape
+        self.grid = CompactGrid(width, height, walkable=memoryview(cells.reshape(-1)))
+        self.grid.start = sy * width + sx
+        self.grid.goal = gy * width + gx
+        self.start_node = self.get_node(sx, sy)
+        self.goal_node = self.get_node(gx, gy)
+
+    def get_node(self, x, y):
+        """
+        Returns the cell on the given index, creating it on first access
+        :param x: X coordinate
+        :param y: Y coordinate
+        :return: GridCell instance
+        """
+        return self.grid.cell(x, y)
+
+
+def load_board(board_path, mode='r'):
+    """
+    Reads a board in either the text or the binary format, depending on the file suffix
+    :param board_path: Path to the board
+    :param mode: numpy.memmap mode used for binary boards
+    :return: Tuple of the start and goal coordinates and a (height, width) uint8 array of cell costs
+    """
+
+    if board_path.endswith(BINARY_BOARD_SUFFIX):
+        return load_binary_board(board_path, mode=mode)
+    return read_text_board(board_path)
+
+
+_worker_service = None
+
+
+def _init_path_worker(service):
+    global _worker_service
+    _worker_service = service
+
+
+def _path_worker(query):
+    return _worker_service.query(*query)
+
+
+class PathService(object):
+    """
+    Answers shortest path queries between arbitrary start and goal cells of one board. The board cells are never
+    written to, and each query keeps its g values, parents and closed flags in tables local to that search, so any
+    number of queries can run against the same grid, also concurrently in forked worker processes that share
+    the cells through copy on write or a read only memory map
+    """
+
+    def __init__(self, cells, mode='manhattan', landmarks=None):
+        """
+        Constructor
+        :param cells: (height, width) uint8 array, 0 for obstacles and the arc cost for walkable cells
+        :param mode: Heuristic, one of the keys of DISTANCE_OFFSETS or 'landmarks'
+        :param landmarks: Landmark distances for the 'landmarks' mode, computed from the cells if not given
+        """
+
+        self.height, self.width = cells.shape
+        self.start = None
+        self.goal = None
+        self.cells = cells.view()
+        self.cells.setflags(write=False)
+        self.costs = memoryview(self.cells.reshape(-1))
+        self.mode = mode
+        if mode == 'landmarks':
+            self.distance = None
+            self.landmarks = compute_landmarks(cells) if landmarks is None else landmarks
+        else:
+            self.distance = DISTANCE_OFFSETS[mode]
+            self.landmarks = None
+
+    @classmethod
+    def from_file(cls, board_path, mode='manhattan'):
+        """
+        Creates a service for a board file. Binary boards are mapped read only, and landmark distances are
+        persisted next to the board
+        :param board_path: Path to a text or binary board
+        :param mode: Heuristic, one of the keys of DISTANCE_OFFSETS or 'landmarks'
+        """
+
+        start, goal, cells = load_board(board_path)
+        landmarks = load_landmarks(board_path, cells) if mode == 'landmarks' else None
+        service = cls(cells, mode=mode, landmarks=landmarks)
+        service.start, service.goal = start, goal
+        return service
+
+    def neighbours(self, index):
+        """
+        Returns the walkable cells adjacent to a cell, in the same order as NavigationProblem
+        :param index: Cell index, y * width + x
+        """
+
+        width, costs = self.width, self.costs
+        x, y = index % width, index // width
+        neighbours = []
+        if x < width - 1 and costs[index + 1]:
+            neighbours.append(index + 1)
+        if y > 0 and costs[index - width]:
+            neighbours.append(index - width)
+        if x > 0 and costs[index - 1]:
+            neighbours.append(index - 1)
+        if y < self.height - 1 and costs[index + width]:
+            neighbours.append(index + width)
+        return neighbours
+
+    def query(self, start, goal):
+        """
+        Runs A* from start to goal. Moving out of a cell costs the arc cost of that cell, as in NavigationProblem
+        :param start: Start coordinates
+        :param goal: Goal coordinates
+        :return: A dict with the path as a list of coordinates (empty if the goal is unreachable), its cost
+        (None if unreachable) and the number of expanded cells
+        :raises ValueError: If start or goal is outside the board
+        """
+
+        width, costs, distance, landmarks = self.width, self.costs, self.distance, self.landmarks
+        (sx, sy), (gx, gy) = start, goal
+        for x, y in (start, goal):
+            if not (0 <= x < width and 0 <= y < self.height):
+                raise ValueError('Cell (%d, %d) is outside the %dx%d board' % (x, y, width, self.height))
+        source, target = sy * width + sx, gy * width + gx
+        if not (costs[source] and costs[target]):
+            return {'path': [], 'cost': None, 'expanded': 0}
+
+        if landmarks is None:
+            def estimate(index):
+                return distance(index % width - gx, index // width - gy)
+        else:
+            estimate = landmark_estimator(landmarks, target)
+
+        g = {source: 0}
+        parent = {source: -1}
+        closed = set()
+        h = estimate(source)
+        open_set = [(h, h, source)]
+        expanded = 0
+
+        while open_set:
+            f, h, index = heapq.heappop(open_set)
+            if index in closed:
+                continue
+            closed.add(index)
+            expanded += 1
+
+            if index == target:
+                path = []
+                while index != -1:
+                    path.append((index % width, index // width))
+                    index = parent[index]
+                path.reverse()
+                return {'path': path, 'cost': g[target], 'expanded': expanded}
+
+            cost = g[index] + costs[index]
+            for successor in self.neighbours(index):
+                if successor not in closed and cost < g.get(successor, cost + 1):
+                    g[successor] = cost
+                    parent[successor] = index
+                    h = estimate(successor)
+                    heapq.heappush(open_set, (cost + h, h, successor))
+
+        return {'path': [], 'cost': None, 'expanded': expanded}
+
+    def query_all(self, queries, processes=0):
+        """
+        Answers a batch of queries
+        :param queries: Iterable of (start, goal) coordinate pairs
+        :param processes: Number of worker processes to spread the queries over, 0 answers them in this process
+        and None uses one process per core. Workers are forked, so the queries are answered in this process on
+        platforms that cannot fork, see GACPool.supported()
+        :return: List of query results, in the order of the queries
+        """
+
+        queries = list(queries)
+        if processes != 0 and not GACPool.supported():
+            log('Cannot fork worker processes on this platform, answering queries in this process')
+            processes = 0
+        if processes == 0:
+            return [self.query(start, goal) for start, goal in queries]
+
+        with multiprocessing.get_context('fork').Pool(
+            processes=processes, initializer=_init_path_worker, initargs=(self,)
+        ) as pool:
+            chunksize = max(1, len(queries) // (4 * (processes or multiprocessing.cpu_count())))
+            return pool.map(_path_worker, queries, chunksize=chunksize)
@@ -2,19 +2,40 @@
 #
 # Created by 'hakloev' on 9/9/15
 
-from copy import deepcopy
-from algorithms import AStarProblem, GAC
-from datastructures import AStarState, CSPState
+from algorithms import AStarProblem, GAC, GACPool
+from datastructures import CSPNode, CSPState
 from common import *
 
 
+VARIABLE_ORDERS = [
+    'first',
+    'mrv',
+    'degree',
+    'domwdeg'
+]
+VALUE_ORDERS = [
+    'default',
+    'lcv'
+]
+
+
 class VCProblem(AStarProblem):
 
-    def __init__(self, nodes, edges, cf=lambda x, y: x != y):
+    gac_class = GAC
+    node_class = CSPNode
+
+    def __init__(self, nodes, edges, cf=lambda x, y: x != y, backend='set', variable_order='first',
+                 value_order='default', processes=0):
         """
         Constructor for VCProblem
         :param nodes: nodes in the VC-problem
         :param edges: edges between the nodes in the VC-problem
+        :param cf: The constraint function between adjacent nodes
+        :param backend: Domain representation, 'set' or 'bitset'
+        :param variable_order: How to choose the node to branch on, one of VARIABLE_ORDERS
+        :param value_order: How to order the values of the branching node, one of VALUE_ORDERS
+        :param processes: Number of worker processes to filter children in, 0 filters them in this process.
+        The workers run until close() is called, or the problem is used as a context manager
         """
         self.constraints = {}
         for from_node, to_node in edges:
@@ -25,11 +46,32 @@ class VCProblem(AStarProblem):
                 self.constraints[to_node] = []
             self.constraints[to_node].append(from_node)
 
-        self.gac = GAC(csp_state=CSPState(nodes), cnet=self.constraints, cf=cf)
+        self.cf = cf
+        self.select_variable = {
+            'first': self.select_first,
+            'mrv': self.select_mrv,
+            'degree': self.select_degree,
+            'domwdeg': self.select_domwdeg
+        }[variable_order]
+        self.order_values = {
+            'default': lambda node, domains: list(domains[node]),
+            'lcv': self.order_lcv
+        }[value_order]
+
+        # Statistics: number of branching nodes, and number of assignments pruned by a contradiction
+        self.branches = 0
+        self.failures = 0
+
+        self.gac = self.gac_class(csp_state=CSPState(nodes, backend=backend), cnet=self.constraints, cf=cf)
 
         self.gac.initialize()
         self.gac.domain_filtering_loop()
-        self.initial_state = AStarState()
+        self.brancher = self.gac
+        if processes and GACPool.supported():
+            self.brancher = GACPool(self.gac, processes=processes)
+        elif processes:
+            log('Cannot fork worker processes on this platform, branching in this process')
+        self.initial_state = self.node_class()
         self.initial_state.state = self.gac.csp_state
         self.goal_node = None
 
@@ -39,6 +81,20 @@ class VCProblem(AStarProblem):
             log("Found solution for VCProblem after first domain filtering loop")
             print("Found solution for VCProblem after first domain filtering loop")  # Should add debug flag here!
 
+    def close(self):
+        """
+        Stops the worker processes of the brancher, if any. Later branching is done in this process
+        """
+        if self.brancher is not self.gac:
+            self.brancher.close()
+            self.brancher = self.gac
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def get_start_node(self):
         """
         Get the initital state (start node) for this specific problem
@@ -63,25 +119,88 @@ class VCProblem(AStarProblem):
         csp_state = astar_state.state
         successor_nodes = []
 
-        for node, domains in csp_state.nodes.items():
-            if len(domains) > 1:
-                for d in range(len(domains)):
+        node = self.select_variable(csp_state.nodes)
+        if node is None:
+            return successor_nodes
 
-                    child_state = deepcopy(csp_state)
-                    child_state.nodes[node] = {list(domains)[d]}
+        self.branches += 1
+        for child_state in self.brancher.branch(csp_state, node, self.order_values(node, csp_state.nodes)):
+            if DEBUG:
+                print("Domain for %s is now %s" % (node, str(child_state.nodes[node])))
 
-                    if DEBUG:
-                        print("Domain for %s is now %s" % (node, str(child_state.nodes[node])))
+            if not child_state.contradiction:
+                astar_state = self.node_class()
+                astar_state.state = child_state
+                successor_nodes.append(astar_state)
+            else:
+                self.failures += 1
 
-                    self.gac.csp_state = child_state
-                    self.gac.run_again(node)
+        return successor_nodes
 
-                    if not child_state.contradiction:
-                        astar_state = AStarState()
-                        astar_state.state = child_state
-                        successor_nodes.append(astar_state)
+    def unassigned_degree(self, node, domains):
+        """
+        Counts the neighbours of a node that have not been assigned a value yet
+        """
+        return sum(1 for neighbour in self.constraints.get(node, ()) if len(domains[neighbour]) > 1)
+
+    def weighted_degree(self, node, domains):
+        """
+        Sums the GAC constraint weights between a node and its unassigned neighbours
+        """
+        weights = self.gac.weights
+        return sum(weights.get((node, neighbour), 1)
+                   for neighbour in self.constraints.get(node, ()) if len(domains[neighbour]) > 1)
 
-                return successor_nodes
+    @staticmethod
+    def select_first(domains):
+        """
+        Selects the first unassigned node, in dict order
+        :param domains: Dict mapping from node to domain
+        :return: The node to branch on, or None if all nodes are assigned
+        """
+        return next((node for node, domain in domains.items() if len(domain) > 1), None)
+
+    def select_mrv(self, domains):
+        """
+        Minimum remaining values: selects the unassigned node with the smallest domain,
+        breaking ties by the number of unassigned neighbours
+        """
+        unassigned = [node for node, domain in domains.items() if len(domain) > 1]
+        if not unassigned:
+            return None
+        return min(unassigned, key=lambda node: (len(domains[node]), -self.unassigned_degree(node, domains)))
+
+    def select_degree(self, domains):
+        """
+        Selects the unassigned node with the most unassigned neighbours, breaking ties by domain size
+        """
+        unassigned = [node for node, domain in domains.items() if len(domain) > 1]
+        if not unassigned:
+            return None
+        return min(unassigned, key=lambda node: (-self.unassigned_degree(node, domains), len(domains[node])))
+
+    def select_domwdeg(self, domains):
+        """
+        Selects the unassigned node with the smallest ratio of domain size to weighted degree, where constraint
+        weights grow each time the constraint caused a contradiction during domain filtering
+        """
+        unassigned = [node for node, domain in domains.items() if len(domain) > 1]
+        if not unassigned:
+            return None
+        return min(unassigned, key=lambda node: len(domains[node]) / max(self.weighted_degree(node, domains), 1))
+
+    def order_lcv(self, node, domains):
+        """
+        Least constraining value: orders the values of a node by how many values they rule out in the
+        domains of its unassigned neighbours, fewest first
+        :param node: The node to order the values of
+        :param domains: Dict mapping from node to domain
+        :return: List of values
+        """
+        neighbours = [n for n in self.constraints.get(node, ()) if len(domains[n]) > 1]
+        return sorted(domains[node], key=lambda value: sum(
+            1 for neighbour in neighbours for other in domains[neighbour] if not self.cf(value, other)
+        ))
 
     def heuristic(self, astar_state):
         """"
@@ -95,7 +214,7 @@ class VCProblem(AStarProblem):
         :param: The state to calculate the heuristic on
         :return: The heuristic for the given state
         """
-        h = sum((len(domains) - 1) for domains in astar_state.state.nodes.values())
+        h = astar_state.state.size - len(astar_state.state.store.domains)
         if h == 0:
             self.goal_node = astar_state
             astar_state.is_goal = True
@@ -2,22 +2,300 @@
 #
 # Created by 'myth' on 10/3/15
 
-from copy import deepcopy
+from functools import reduce
+from operator import and_, or_
+import sys
 
-from algorithms import AStarProblem, GAC
+from algorithms import AStarProblem, GAC, GACPool
 from common import *
-from datastructures import AStarState, CSPState
+from datastructures import AStarState, CSPNode, CSPState
+
+# Lines with more patterns than this are kept as the bitmasks of their fixed cells, see LineDomain
+PATTERN_LIMIT = 1024
+
+
+def reverse_cells(cells, cols):
+    """
+    Mirrors a bitmask of cells in a line of the given length
+    """
+    return int(format(cells, '0%db' % cols)[::-1], 2) if cols else 0
+
+
+def line_domain(counts, cols, index, filled=0, blank=0, limit=PATTERN_LIMIT):
+    """
+    Creates the domain of a line holding the patterns agreeing with the given fixed cells. The patterns are
+    enumerated as (line index, bitmask) values if there are at most limit of them, and described by a
+    LineDomain otherwise
+    :param counts: A sequence of segment sizes
+    :param cols: The number of cells in the line
+    :param index: The row or column number of the line, stored in its values
+    :param filled: Bitmask of cells that must be filled
+    :param blank: Bitmask of cells that must be blank
+    :param limit: The largest number of patterns to enumerate
+    :return: A list of values, empty if no pattern agrees with the cells, or a LineDomain
+    """
+    solved = NonogramProblem.line_solve(counts, cols, filled, blank)
+    if solved is None:
+        return []
+    filled, blank = solved
+    size = NonogramProblem.count_patterns(counts, cols, filled, blank)
+    if size <= limit:
+        return [(index, p) for p in NonogramProblem.iter_patterns(counts, cols, filled, blank)]
+    return LineDomain(counts, cols, index, filled, blank, size, limit)
+
+
+class LineDomain(object):
+    """
+    An implicit domain of a line (see CSPState), the patterns agreeing with the line's fixed cells. Only the
+    bitmasks of the fixed cells are stored, which line_solve has extended with every cell the patterns agree on,
+    so the same patterns are always described by the same masks. Reducing the domain goes through line_domain,
+    which enumerates the patterns once there are few enough of them
+    """
+
+    __slots__ = ('counts', 'cols', 'index', 'filled', 'blank', 'size', 'limit')
+
+    def __init__(self, counts, cols, index, filled, blank, size, limit):
+        self.counts = counts
+        self.cols = cols
+        self.index = index
+        self.filled = filled
+        self.blank = blank
+        self.size = size
+        self.limit = limit
+
+    def restrict(self, filled=0, blank=0):
+        """
+        :return: The domain of the patterns that also agree with the given fixed cells
+        """
+        return line_domain(self.counts, self.cols, self.index, self.filled | filled, self.blank | blank, self.limit)
+
+    def only(self, cells):
+        """
+        Same as restrict, taking a tuple of the filled and blank bitmasks, so CSPState.assign can branch on cells
+        """
+        return self.restrict(*cells)
+
+    def domain_hash(self, node):
+        return hash((node, self.filled, self.blank))
+
+    def __len__(self):
+        return min(self.size, sys.maxsize)
+
+    def __bool__(self):
+        return True
+
+    def __iter__(self):
+        for pattern in NonogramProblem.iter_patterns(self.counts, self.cols, self.filled, self.blank):
+            yield self.index, pattern
+
+    def __eq__(self, other):
+        if not isinstance(other, LineDomain):
+            return NotImplemented
+        return (self.index, self.cols, self.counts, self.filled, self.blank) == \
+            (other.index, other.cols, other.counts, other.filled, other.blank)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'LineDomain(%d patterns, filled %s, blank %s)' % (
+            self.size, format(self.filled, '0%db' % self.cols), format(self.blank, '0%db' % self.cols)
+        )
+
+
+class LineGAC(GAC):
+    """
+    GAC specialized for nonograms, where every domain value is a (line index, bitmask) pattern.
+    Revising a line against a crossing line only looks at the shared cell: the crossing line allows a filled
+    cell if any of its patterns fills it, and a blank cell unless all of its patterns fill it.
+    Both are read from the OR and AND of the crossing line's patterns, which are cached per domain
+
+    The filtering loop works line by line instead of arc by arc. Taking a line off the queue intersects its
+    patterns to find its fixed cells, and filters every crossing line that does not yet agree with them,
+    queueing the crossing lines that changed. This repeats until no line changes, and reaches the same
+    fixpoint as the arc revisions. The crossing line at cell x of a line is the x-th node in its constraint list
+
+    Lines with a LineDomain are read from and filtered through its fixed cells, without enumerating patterns
+    """
+
+    def __init__(self, cnet=None, csp_state=None, cf=None):
+        super(LineGAC, self).__init__(cnet=cnet, csp_state=csp_state, cf=cf)
+        self.cells = {}
+
+    def compile_constraints(self):
+        """
+        Line revisions do not use constraint tables
+        """
+        pass
+
+    def line_cells(self, node, domain):
+        """
+        :return: Tuple of two bitmasks, the cells filled by any and by all of the patterns in the domain
+        """
+        if isinstance(domain, LineDomain):
+            return ((1 << domain.cols) - 1) & ~domain.blank, domain.filled
+        entry = self.cells.get(node)
+        if entry is None or entry[0] is not domain:
+            masks = [mask for line, mask in domain]
+            entry = self.cells[node] = (domain, reduce(or_, masks, 0), reduce(and_, masks, -1 if masks else 0))
+        return entry[1], entry[2]
+
+    @staticmethod
+    def line_index(domain):
+        """
+        :return: The row or column number of the line a non-empty domain belongs to
+        """
+        return domain.index if isinstance(domain, LineDomain) else domain[0][0]
+
+    @staticmethod
+    def fix_cell(domain, cell, filled):
+        """
+        :return: The domain reduced to the patterns where the given cell is filled, or blank if filled is 0
+        """
+        if isinstance(domain, LineDomain):
+            return domain.restrict(filled << cell, (1 - filled) << cell)
+        return [value for value in domain if (value[1] >> cell & 1) == filled]
+
+    def initialize(self):
+        """
+        Initializes the queue with all lines. A line without any patterns makes the state a contradiction
+        """
+        for node in self.cnet:
+            if not self.csp_state.nodes[node]:
+                self.csp_state.contradiction = True
+            self.enqueue_line(node)
+
+        log('Queue initialized with %d lines' % len(self.queue))
+
+    def enqueue_line(self, node):
+        """
+        Adds a line to the queue, unless it is already waiting in it
+        :param node: The line whose fixed cells are to be pushed to its crossing lines
+        """
+        if node not in self.queued:
+            self.queued.add(node)
+            self.queue.append(node)
+
+    def propagate_line(self, node):
+        """
+        Pushes the fixed cells of a line to its crossing lines, removing their patterns that disagree
+        :param node: The line to propagate from
+        :return: List of the crossing lines that were changed
+        """
+        self.revisions += 1
+        nodes = self.csp_state.nodes
+        domain = nodes[node]
+        if not domain:
+            self.csp_state.contradiction = True
+            return []
+
+        index = self.line_index(domain)
+        any_filled, all_filled = self.line_cells(node, domain)
+        changed = []
+        for cell, crossing in enumerate(self.cnet[node]):
+            other_domain = nodes[crossing]
+            if not other_domain:
+                self.csp_state.contradiction = True
+                break
+
+            filled = all_filled >> cell & 1
+            if not filled and any_filled >> cell & 1:
+                continue
+            other_any, other_all = self.line_cells(crossing, other_domain)
+            if filled and other_all >> index & 1 or not filled and not other_any >> index & 1:
+                continue
+
+            kept = self.fix_cell(other_domain, index, filled)
+            self.removals += len(other_domain) - len(kept)
+            self.csp_state.set_domain(crossing, kept)
+            changed.append(crossing)
+            if not kept:
+                self.wipeout(crossing, node)
+                break
+
+        return changed
+
+    def domain_filtering_loop(self):
+        """
+        Propagates lines from the queue until no line changes, or a line runs out of patterns
+        """
+        if self.csp_state.contradiction:
+            self.queue.clear()
+            self.queued.clear()
+
+        while self.queue:
+            node = self.queue.popleft()
+            self.queued.discard(node)
+            for crossing in self.propagate_line(node):
+                self.enqueue_line(crossing)
+
+            if self.csp_state.contradiction:
+                self.queue.clear()
+                self.queued.clear()
+
+    def run_again(self, node):
+        """
+        Propagates from a line whose domain was reduced
+        :param node: The changed line
+        """
+        self.enqueue_line(node)
+        self.domain_filtering_loop()
+
+    def revise(self, from_node, to_node):
+        """
+        Removes the patterns of from_node that disagree with every pattern of to_node in their shared cell
+        :param from_node: The line whose domain is revised
+        :param to_node: The crossing line
+        :return: Boolean telling whether the domain was revised or not
+        """
+        self.revisions += 1
+        domain = self.csp_state.nodes[from_node]
+        other_domain = self.csp_state.nodes[to_node]
+        if not domain or not other_domain:
+            self.csp_state.contradiction = True
+            return False
+
+        cell = self.line_index(domain)
+        crossing = self.line_index(other_domain)
+        any_filled, all_filled = self.line_cells(to_node, other_domain)
+        can_fill = any_filled >> cell & 1
+        can_blank = not all_filled >> cell & 1
+        if can_fill and can_blank:
+            return False
+
+        kept = self.fix_cell(domain, crossing, can_fill)
+        if len(kept) == len(domain):
+            return False
+
+        self.removals += len(domain) - len(kept)
+        self.csp_state.set_domain(from_node, kept)
+        if not kept:
+            self.wipeout(from_node, to_node)
+        return True
 
 
 class NonogramProblem(AStarProblem):
 
-    def __init__(self, path):
+    gac_class = LineGAC
+    node_class = CSPNode
+
+    def __init__(self, path, processes=0, pattern_limit=PATTERN_LIMIT):
         """
         Constructor for the NonogramProblem
-        Will set up the grid and create all nodes with all possible permutations as domains
+        Will set up the grid and create all nodes with all possible permutations as domains.
+        Cells are first fixed by line solving, and only the permutations agreeing with them are enumerated.
+        Lines with more than pattern_limit permutations are kept as LineDomains until filtering or branching
+        fixes enough of their cells, which bounds the memory used by large puzzles
+        :param path: Path to the nonogram file
+        :param processes: Number of worker processes to filter children in, 0 filters them in this process.
+        The workers run until close() is called, or the problem is used as a context manager
+        :param pattern_limit: The largest number of patterns to enumerate for a line
         """
 
         self.nodes = {}
+        self.clues = {}
         with open(path) as f:
             cols, rows = map(int, f.readline().split())
 
@@ -29,10 +307,17 @@ class NonogramProblem(AStarProblem):
             for row in range(rows):
                 r_reversed.append(list(map(int, f.readline().split())))
             for row, counts in enumerate(reversed(r_reversed)):
-                self.nodes[row] = [(row, p) for p in self.gen_patterns(counts, cols)]
+                self.clues[row] = counts
             for col in range(cols):
-                counts = list(map(int, f.readline().split()))
-                self.nodes[rows + col] = [(col, p) for p in self.gen_patterns(counts, rows)]
+                self.clues[rows + col] = list(map(int, f.readline().split()))
+
+        # Cells fixed by line solving, so only the patterns agreeing with them are enumerated
+        self.filled, self.blank = self.infer_cells()
+        for node, counts in self.clues.items():
+            self.nodes[node] = line_domain(
+                counts, self.line_length(node), self.line_index(node), self.filled[node], self.blank[node],
+                pattern_limit
+            )
 
         if DEBUG:
             for x in range(rows + cols):
@@ -44,54 +329,214 @@ class NonogramProblem(AStarProblem):
         def cf(a, b):
             r, domain_a = a
             c, domain_b = b
-            return domain_a[c] == domain_b[r]
+            return (domain_a >> c & 1) == (domain_b >> r & 1)
 
-        self.gac = GAC(cnet=self.constraints, csp_state=CSPState(self.nodes), cf=cf)
+        self.gac = self.gac_class(cnet=self.constraints, csp_state=CSPState(self.nodes), cf=cf)
         self.gac.initialize()
         self.gac.domain_filtering_loop()
-        self.initial_state = AStarState()
+        self.brancher = self.gac
+        if processes and GACPool.supported():
+            self.brancher = GACPool(self.gac, processes=processes)
+        elif processes:
+            log('Cannot fork worker processes on this platform, branching in this process')
+        self.initial_state = self.node_class()
         self.initial_state.state = self.gac.csp_state
 
         log('NonogramProblem initialized with %dx%d grid' % (rows, cols))
 
+    def close(self):
+        """
+        Stops the worker processes of the brancher, if any. Later branching is done in this process
+        """
+        if self.brancher is not self.gac:
+            self.brancher.close()
+            self.brancher = self.gac
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def line_index(self, node):
+        """
+        :return: The row or column number of a line node
+        """
+        return node if node < self.total_rows else node - self.total_rows
+
+    def line_length(self, node):
+        """
+        :return: The number of cells in a line node
+        """
+        return self.total_cols if node < self.total_rows else self.total_rows
+
+    def crossing_node(self, node, cell):
+        """
+        :return: The line node crossing the given line node at the given cell
+        """
+        return self.total_rows + cell if node < self.total_rows else cell
+
+    def infer_cells(self):
+        """
+        Fixes cells from the clues alone by solving every line whose crossing lines gained fixed cells with
+        line_solve, until no line changes. Patterns are only enumerated afterwards
+        :return: Tuple of two dicts mapping from line node to the bitmasks of its filled and blank cells
+        """
+
+        filled = {node: 0 for node in self.clues}
+        blank = {node: 0 for node in self.clues}
+        pending = set(self.clues)
+
+        while pending:
+            node = pending.pop()
+            result = self.line_solve(self.clues[node], self.line_length(node), filled[node], blank[node])
+            if result is None:
+                # No pattern fits the line, its domain will be empty
+                continue
+
+            index = self.line_index(node)
+            for cells, known in zip(result, (filled, blank)):
+                new = cells & ~known[node]
+                known[node] = cells
+                while new:
+                    low = new & -new
+                    crossing = self.crossing_node(node, low.bit_length() - 1)
+                    known[crossing] |= 1 << index
+                    pending.add(crossing)
+                    new ^= low
+
+        fixed = sum(bin(filled[row] | blank[row]).count('1') for row in range(self.total_rows))
+        log('Line solving fixed %d of %d cells' % (fixed, self.total_rows * self.total_cols))
+        return filled, blank
+
+    @staticmethod
+    def pattern_ways(counts, cols, filled=0, blank=0):
+        """
+        Counts the patterns of a line agreeing with the given fixed cells, without enumerating them
+        :param counts: A sequence of segment sizes
+        :param cols: The number of cells in the line
+        :param filled: Bitmask of cells that must be filled
+        :param blank: Bitmask of cells that must be blank
+        :return: Table where ways[i][x] is the number of ways to place segments i and onwards in cells x and onwards
+        """
+
+        counts = [count for count in counts if count]
+        ways = [[0] * (cols + 2) for _ in range(len(counts) + 1)]
+        for x in range(cols + 1):
+            ways[len(counts)][x] = 0 if filled >> x else 1
+
+        for i in range(len(counts) - 1, -1, -1):
+            count = counts[i]
+            block = (1 << count) - 1
+            for x in range(cols - 1, -1, -1):
+                w = 0 if filled >> x & 1 else ways[i][x + 1]
+                end = x + count
+                if end <= cols and not blank >> x & block and not (end < cols and filled >> end & 1):
+                    w += ways[i + 1][min(end + 1, cols)]
+                ways[i][x] = w
+
+        return ways
+
+    @staticmethod
+    def count_patterns(counts, cols, filled=0, blank=0):
+        """
+        :return: The number of patterns of a line agreeing with the given fixed cells
+        """
+        return NonogramProblem.pattern_ways(counts, cols, filled, blank)[0][0]
+
+    @staticmethod
+    def iter_patterns(counts, cols, filled=0, blank=0):
+        """
+        Lazily generates the patterns of a line agreeing with the given fixed cells, segment starts in
+        lexicographic order. Placements that cannot be completed are skipped using pattern_ways, so every
+        pattern is produced without backtracking and without building any intermediate lists
+        :param counts: A sequence of segment sizes
+        :param cols: The number of cells in the line
+        :param filled: Bitmask of cells that must be filled
+        :param blank: Bitmask of cells that must be blank
+        :return: A generator of patterns, as integer bitmasks with bit x set if cell x is filled
+        """
+
+        counts = [count for count in counts if count]
+        ways = NonogramProblem.pattern_ways(counts, cols, filled, blank)
+
+        def place(i, x, pattern):
+            if i == len(counts):
+                yield pattern
+                return
+            count = counts[i]
+            block = (1 << count) - 1
+            for start in range(x, cols - count + 1):
+                end = start + count
+                if not blank >> start & block and not (end < cols and filled >> end & 1) \
+                        and ways[i + 1][min(end + 1, cols)]:
+                    for rest in place(i + 1, min(end + 1, cols), pattern | block << start):
+                        yield rest
+                if filled >> start & 1:
+                    break
+
+        if ways[0][0]:
+            for pattern in place(0, 0, 0):
+                yield pattern
+
     @staticmethod
     def gen_patterns(counts, cols):
         """
         Generates pattern permutations for a given number of segments
         :param counts: A sequence of segment sizes
         :param cols: The number of columns in the matrix
-        :return: A pattern matrix
-        """
-
-        if len(counts) == 0:
-            row = []
-            for x in range(cols):
-                row.append(False)
-            return [row]
-
-        permutations = []
-
-        for start in range(cols - counts[0] + 1):
-            permutation = []
-            for x in range(start):
-                permutation.append(False)
-            for x in range(start, start + counts[0]):
-                permutation.append(True)
-            x = start + counts[0]
-            if x < cols:
-                permutation.append(False)
-                x += 1
-            if x == cols and len(counts) == 0:
-                permutations.append(permutation)
-                break
-            sub_start = x
-            sub_rows = NonogramProblem.gen_patterns(counts[1:len(counts)], cols - sub_start)
-            for sub_row in sub_rows:
-                sub_permutation = deepcopy(permutation)
-                for x in range(sub_start, cols):
-                    sub_permutation.append(sub_row[x - sub_start])
-                permutations.append(sub_permutation)
-        return permutations
+        :return: A list of patterns, as integer bitmasks with bit x set if cell x is filled
+        """
+        return list(NonogramProblem.iter_patterns(counts, cols))
+
+    @staticmethod
+    def line_solve(counts, cols, filled=0, blank=0):
+        """
+        Finds the cells that are the same in every pattern agreeing with the given fixed cells, which is the
+        intersection of the patterns, without enumerating them. A segment can be placed at a start if the
+        segments before it fit in front of it and the segments after it fit behind it, and a cell can be blank
+        if the segments before and after some gap fit around it. The segments fitting in front are counted by
+        pattern_ways on the mirrored line
+        :return: Tuple of the bitmasks of filled and blank cells, including the given ones, or None if no pattern
+        agrees with the given cells
+        """
+
+        counts = [count for count in counts if count]
+        ways = NonogramProblem.pattern_ways(counts, cols, filled, blank)
+        if not ways[0][0]:
+            return None
+        mirrored = NonogramProblem.pattern_ways(
+            counts[::-1], cols, reverse_cells(filled, cols), reverse_cells(blank, cols)
+        )
+
+        def fits_before(i, x):
+            # Segments 0..i-1 fit in cells 0..x-1
+            return mirrored[len(counts) - i][cols - x]
+
+        can_fill = can_blank = 0
+        for x in range(cols):
+            if filled >> x & 1:
+                continue
+            for i in range(len(counts) + 1):
+                if fits_before(i, x) and ways[i][x + 1]:
+                    can_blank |= 1 << x
+                    break
+
+        for i, count in enumerate(counts):
+            block = (1 << count) - 1
+            for start in range(cols - count + 1):
+                end = start + count
+                if blank >> start & block or end < cols and filled >> end & 1:
+                    continue
+                if start and (filled >> (start - 1) & 1 or not fits_before(i, start - 1)):
+                    continue
+                if not start and i:
+                    continue
+                if ways[i + 1][min(end + 1, cols)]:
+                    can_fill |= block << start
+
+        cells = (1 << cols) - 1
+        return filled | cells & ~can_blank, blank | cells & ~can_fill
 
     def generate_constraints(self):
         """
@@ -106,6 +551,16 @@ class NonogramProblem(AStarProblem):
         for col in range(self.total_cols):
             self.constraints[self.total_rows + col] = [i for i in range(0, self.total_rows)]
 
+    @staticmethod
+    def drawn_cells(domain):
+        """
+        :return: Bitmask of the cells to draw filled for a line, those of its first pattern, or the cells fixed as
+        filled if its patterns are not enumerated
+        """
+        if isinstance(domain, LineDomain):
+            return domain.filled
+        return domain[0][1] if domain else 0
+
     def get_start_node(self):
         """
         Returns the start node for this problem instance
@@ -120,8 +575,8 @@ class NonogramProblem(AStarProblem):
         :param astar_state: The state to calculate h for
         :return: The h value
         """
-        h = sum((len(domains) - 1) for domains in astar_state.state.nodes.values())
-        if h == 0:
+        h = astar_state.state.size - len(astar_state.state.store.domains)
+        if h == 0 and not astar_state.state.contradiction:
             astar_state.is_goal = True
         astar_state.h = h
         return h
@@ -151,28 +606,34 @@ class NonogramProblem(AStarProblem):
         """
         csp_state = astar_state.state
         successor_nodes = []
+        if csp_state.contradiction:
+            return successor_nodes
 
-        #  TODO: Is this verified?
-        for node, domains in csp_state.nodes.items():
-            if len(domains) > 1:
-                for d in range(len(domains)):
-                    print(node, domains[d])
-                    child_state = deepcopy(csp_state)
-
-                    child_state.nodes[node] = [list(domains)[d]]
+        # Branch on the line with the fewest patterns left, every pattern costs a propagation
+        unassigned = [node for node, domains in csp_state.nodes.items() if len(domains) > 1]
+        if not unassigned:
+            return successor_nodes
+        node = min(unassigned, key=lambda n: len(csp_state.nodes[n]))
+        domain = csp_state.nodes[node]
 
-                    if DEBUG:
-                        print("Domain for %s is now %s" % (node, str(child_state.nodes[node])))
+        if isinstance(domain, LineDomain):
+            # Too many patterns to branch on, so branch on filling or blanking the first cell that is not fixed
+            free = ~(domain.filled | domain.blank)
+            cell = free & -free
+            values = [(cell, 0), (0, cell)]
+        else:
+            values = list(domain)
 
-                    self.gac.csp_state = child_state
-                    self.gac.run_again(node)
+        for child_state in self.brancher.branch(csp_state, node, values):
+            if DEBUG:
+                print("Domain for %s is now %s" % (node, str(child_state.nodes[node])))
 
-                    if not child_state.contradiction:
-                        astar_state = AStarState()
-                        astar_state.state = child_state
-                        successor_nodes.append(astar_state)
+            if not child_state.contradiction:
+                astar_state = self.node_class()
+                astar_state.state = child_state
+                successor_nodes.append(astar_state)
 
-                return successor_nodes
+        return successor_nodes
 
     def get_node(self, x, y):
         """
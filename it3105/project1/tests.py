@@ -0,0 +1,1267 @@
+# -*- coding: utf8 -*-
+
+import heapq
+import os
+import random
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+from collections import deque
+from unittest import mock
+
+import numpy as np
+
+from algorithms import AStar, ASTAR_OPTIONS, AStarProblem, BidirectionalAStar, GAC, GACPool, LPAStar
+from datastructures import AStarState, BitDomain, CompactGrid, CSPNode, CSPState, DomainCodec, Graph, PriorityQueue
+from module1.navigation import CompactNavigationProblem, JumpPointNavigationProblem, NavigationProblem, PathService, \
+    LANDMARK_DIR, cell_distances, compute_landmarks, convert_board, landmark_bound, landmark_estimator, \
+    load_binary_board, load_landmarks, read_text_board
+from module2.vc import VALUE_ORDERS, VARIABLE_ORDERS, VCProblem
+from module3.nonogram import LineDomain, NonogramProblem
+
+BOARDS_DIR = os.path.join(os.path.dirname(__file__), 'module1', 'boards')
+BOARDS = sorted(os.path.join(BOARDS_DIR, board) for board in os.listdir(BOARDS_DIR) if board.endswith('.txt'))
+GRAPHS_DIR = os.path.join(os.path.dirname(__file__), 'module2', 'graphs')
+NONOGRAMS_DIR = os.path.join(os.path.dirname(__file__), 'module3', 'nonograms')
+
+# Shortest path lengths (in steps) for the bundled boards
+SHORTEST_PATHS = {
+    'board0.txt': 9,
+    'board1.txt': 32,
+    'board2.txt': 38,
+    'board3.txt': 18,
+    'board4.txt': 22,
+    'board5.txt': 58,
+}
+
+
+def write_board(width, height, start, goal, obstacles):
+    """
+    Writes a board file in the module1 format and returns its path
+    """
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    with os.fdopen(fd, 'w') as f:
+        f.write('%d %d\n%d %d %d %d\n' % (width, height, start[0], start[1], goal[0], goal[1]))
+        for obstacle in obstacles:
+            f.write('%d %d %d %d\n' % obstacle)
+    return path
+
+
+def random_board(rng, width, height, obstacle_count):
+    """
+    Generates a random board, returning its path and the BFS distance from start to goal (None if unreachable)
+    """
+    obstacles, blocked = [], set()
+    for _ in range(obstacle_count):
+        ox, oy = rng.randrange(width), rng.randrange(height)
+        ow, oh = min(rng.randint(1, 4), width - ox), min(rng.randint(1, 4), height - oy)
+        if width * height - len(blocked) - ow * oh < 2:
+            break
+        obstacles.append((ox, oy, ow, oh))
+        blocked.update((ox + x, oy + y) for x in range(ow) for y in range(oh))
+
+    free = [(x, y) for x in range(width) for y in range(height) if (x, y) not in blocked]
+    start, goal = rng.sample(free, 2)
+
+    distance = {start: 0}
+    queue = deque([start])
+    while queue:
+        x, y = queue.popleft()
+        for cell in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+            if 0 <= cell[0] < width and 0 <= cell[1] < height and cell not in blocked and cell not in distance:
+                distance[cell] = distance[(x, y)] + 1
+                queue.append(cell)
+
+    return write_board(width, height, start, goal, obstacles), distance.get(goal)
+
+
+def random_nonogram(rng, cols, rows, fill):
+    """
+    Writes a nonogram file with the clues of a random picture and returns its path
+    """
+    picture = [[rng.random() < fill for _ in range(cols)] for _ in range(rows)]
+
+    def clue(cells):
+        runs = [len(run) for run in ''.join('#' if cell else ' ' for cell in cells).split()]
+        return ' '.join(map(str, runs or [0]))
+
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    with os.fdopen(fd, 'w') as f:
+        f.write('%d %d\n' % (cols, rows))
+        for row in picture:
+            f.write(clue(row) + '\n')
+        for col in range(cols):
+            # Columns are read bottom to top
+            f.write(clue(picture[row][col] for row in reversed(range(rows))) + '\n')
+    return path
+
+
+def path_cost(problem, path):
+    """
+    Sums the edge costs along a path given goal first, as returned by the search algorithms
+    """
+    return sum(problem.edge_cost(a, b) for b, a in zip(path, path[1:]))
+
+
+def dijkstra(problem):
+    """
+    Reference shortest path cost from the start to the goal node of a problem, or None if unreachable
+    """
+    start, goal = problem.get_start_node(), problem.get_goal_node()
+    distance = {start: 0}
+    queue = [(0, id(start), start)]
+    while queue:
+        d, _, node = heapq.heappop(queue)
+        if node is goal:
+            return d
+        if d > distance[node]:
+            continue
+        for successor in problem.get_all_successor_nodes(node):
+            cost = d + problem.edge_cost(node, successor)
+            if cost < distance.get(successor, float('inf')):
+                distance[successor] = cost
+                heapq.heappush(queue, (cost, id(successor), successor))
+    return None
+
+
+class Item(object):
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+
+class ChainProblem(AStarProblem):
+    """
+    Problem made of a single chain of nodes with unit arc costs, used to exercise path propagation
+    """
+
+    def __init__(self, length):
+        self.nodes = [AStarState(index=i, x=i, y=0) for i in range(length)]
+        for node, child in zip(self.nodes, self.nodes[1:]):
+            node.children.add(child)
+
+    def get_start_node(self):
+        return self.nodes[0]
+
+    def get_goal_node(self):
+        return self.nodes[-1]
+
+    def get_all_successor_nodes(self, node):
+        return list(node.children)
+
+    def arc_cost(self, node):
+        return 1
+
+    def heuristic(self, node):
+        return len(self.nodes) - 1 - node.index
+
+
+class WeightedGraphProblem(AStarProblem):
+    """
+    Problem on a small directed graph with explicit edge costs and heuristic values
+    """
+
+    def __init__(self, edges, heuristics, start, goal):
+        self.nodes = {name: AStarState(index=i, x=i, y=0) for i, name in enumerate(sorted(heuristics))}
+        self.names = {node: name for name, node in self.nodes.items()}
+        self.edges = edges
+        self.heuristics = heuristics
+        self.start, self.goal = self.nodes[start], self.nodes[goal]
+        self.goal.is_goal = True
+
+    def get_start_node(self):
+        return self.start
+
+    def get_goal_node(self):
+        return self.goal
+
+    def get_all_successor_nodes(self, node):
+        return [self.nodes[name] for name in self.edges.get(self.names[node], {})]
+
+    def edge_cost(self, node, successor):
+        return self.edges[self.names[node]][self.names[successor]]
+
+    def arc_cost(self, node):
+        return 1
+
+    def heuristic(self, node):
+        return self.heuristics[self.names[node]]
+
+
+class NamedState(AStarState):
+    """
+    Node identified by its name rather than by object identity, like CSPNode
+    """
+
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        super(NamedState, self).__init__()
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, NamedState) and self.name == other.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+
+class FreshNodeGraphProblem(WeightedGraphProblem):
+    """
+    Weighted graph problem that builds new node objects for every successor, so states reached again are
+    duplicates equal to the node generated first
+    """
+
+    def __init__(self, edges, heuristics, start, goal):
+        self.edges = edges
+        self.heuristics = heuristics
+        self.start, self.goal = NamedState(start), NamedState(goal)
+
+    def get_all_successor_nodes(self, node):
+        return [NamedState(name) for name in self.edges.get(node.name, {})]
+
+    def edge_cost(self, node, successor):
+        return self.edges[node.name][successor.name]
+
+    def heuristic(self, node):
+        node.is_goal = node == self.goal
+        return self.heuristics[node.name]
+
+
+class PriorityQueueTest(unittest.TestCase):
+
+    def testPopOrder(self):
+        keys = list(range(200))
+        random.shuffle(keys)
+        queue = PriorityQueue()
+        for key in keys:
+            queue.push(Item(key))
+        self.assertEqual([queue.pop().key for _ in range(len(keys))], sorted(keys))
+        self.assertEqual(len(queue), 0)
+
+    def testMembership(self):
+        queue = PriorityQueue()
+        a, b = Item(1), Item(2)
+        queue.push(a)
+        self.assertIn(a, queue)
+        self.assertNotIn(b, queue)
+        queue.pop()
+        self.assertNotIn(a, queue)
+
+    def testDecreaseKey(self):
+        queue = PriorityQueue()
+        items = [Item(key) for key in range(10, 20)]
+        for item in items:
+            queue.push(item)
+        items[-1].key = 0
+        queue.update(items[-1])
+        self.assertIs(queue.pop(), items[-1])
+        self.assertEqual([queue.pop().key for _ in range(9)], list(range(10, 19)))
+
+
+class AStarTest(unittest.TestCase):
+
+    def testShortestPaths(self):
+        for board in BOARDS:
+            with self.subTest(board=os.path.basename(board)):
+                solver = AStar(mode='best', problem=NavigationProblem(board))
+                *_, last = solver.agenda_loop()
+                self.assertTrue(last['path'][0].is_goal)
+                self.assertEqual(len(last['path']) - 1, SHORTEST_PATHS[os.path.basename(board)])
+
+    def testAllModesReachGoal(self):
+        for board in BOARDS:
+            for mode in ASTAR_OPTIONS:
+                with self.subTest(board=os.path.basename(board), mode=mode):
+                    solver = AStar(mode=mode, problem=NavigationProblem(board))
+                    *_, last = solver.agenda_loop()
+                    self.assertTrue(last['path'][0].is_goal)
+
+    def testSolveMatchesAgendaLoop(self):
+        for board in BOARDS:
+            with self.subTest(board=os.path.basename(board)):
+                traced = AStar(mode='best', problem=NavigationProblem(board))
+                steps = list(traced.agenda_loop())
+                result = AStar(mode='best', problem=NavigationProblem(board)).solve()
+                self.assertEqual(len(result['path']), len(steps[-1]['path']))
+                self.assertEqual(result['expanded'], len(steps))
+                self.assertTrue(result['path'][0].is_goal)
+
+    def testPropagatePathCascade(self):
+        length = 100000
+        problem = ChainProblem(length)
+        solver = AStar(mode='best', problem=problem)
+        root = problem.nodes[0]
+
+        # Label the chain as if it was first reached through an expensive detour
+        for node in problem.nodes:
+            node.g = node.index + 10
+            node.h = problem.heuristic(node)
+            node.f = node.g + node.h
+        solver.open_set.push(problem.nodes[-1])
+
+        root.g = 0
+        solver.propagate_path(root)
+
+        self.assertEqual([node.g for node in problem.nodes], list(range(length)))
+        self.assertTrue(all(solver.parent_of[b] is a for a, b in zip(problem.nodes, problem.nodes[1:])))
+        self.assertEqual(problem.nodes[-1].f, length - 1)
+
+    def testReopenedClosedNodeUpdatesDescendants(self):
+        # The inconsistent heuristic of A makes B and C get expanded through the expensive edge S -> B first.
+        # Reaching B again through A must lower the g values of C and G below it
+        problem = WeightedGraphProblem(
+            edges={'S': {'A': 1, 'B': 4}, 'A': {'B': 1}, 'B': {'C': 1}, 'C': {'G': 10}},
+            heuristics={'S': 0, 'A': 4, 'B': 0, 'C': 0, 'G': 0},
+            start='S', goal='G'
+        )
+        result = AStar(mode='best', problem=problem).solve()
+        self.assertEqual(problem.goal.g, 13)
+        self.assertEqual([problem.names[node] for node in result['path']], ['G', 'C', 'B', 'A', 'S'])
+
+    def testDuplicateStateReachedMoreCheaply(self):
+        problem = FreshNodeGraphProblem(
+            edges={'S': {'A': 1, 'B': 5}, 'A': {'B': 1}, 'B': {'G': 1}},
+            heuristics={'S': 0, 'A': 0, 'B': 0, 'G': 0},
+            start='S', goal='G'
+        )
+        result = AStar(mode='best', problem=problem).solve()
+        self.assertEqual(result['path'][0].g, 3)
+        self.assertEqual([node.name for node in result['path']], ['G', 'B', 'A', 'S'])
+
+
+class BidirectionalAStarTest(unittest.TestCase):
+
+    def testShortestPaths(self):
+        for board in BOARDS:
+            for heuristic in ('manhattan', 'euclidean'):
+                with self.subTest(board=os.path.basename(board), heuristic=heuristic):
+                    result = BidirectionalAStar(problem=NavigationProblem(board, mode=heuristic)).solve()
+                    path = result['path']
+                    self.assertTrue(path[0].is_goal)
+                    self.assertTrue(path[-1].is_start)
+                    self.assertEqual(len(path) - 1, SHORTEST_PATHS[os.path.basename(board)])
+                    for a, b in zip(path, path[1:]):
+                        self.assertEqual(abs(a.x - b.x) + abs(a.y - b.y), 1)
+                        self.assertTrue(a.walkable)
+
+    def testTracedSteps(self):
+        solver = BidirectionalAStar(problem=NavigationProblem(BOARDS[0]))
+        steps = list(solver.agenda_loop())
+        self.assertEqual(len(steps), solver.expanded + 1)
+        self.assertTrue(steps[-1]['path'][0].is_goal)
+
+
+class JumpPointSearchTest(unittest.TestCase):
+
+    def assertValidPath(self, problem, path, length):
+        full_path = problem.get_full_path(path)
+        self.assertTrue(full_path[0].is_goal)
+        self.assertTrue(full_path[-1].is_start)
+        self.assertEqual(len(full_path) - 1, length)
+        for a, b in zip(full_path, full_path[1:]):
+            self.assertEqual(abs(a.x - b.x) + abs(a.y - b.y), 1)
+            self.assertTrue(a.walkable)
+
+    def testShortestPaths(self):
+        for board in BOARDS:
+            with self.subTest(board=os.path.basename(board)):
+                problem = JumpPointNavigationProblem(board)
+                result = AStar(mode='best', problem=problem).solve()
+                self.assertEqual(problem.get_goal_node().g, SHORTEST_PATHS[os.path.basename(board)])
+                self.assertValidPath(problem, result['path'], SHORTEST_PATHS[os.path.basename(board)])
+
+    def testFewerExpansions(self):
+        for board in BOARDS:
+            with self.subTest(board=os.path.basename(board)):
+                jps = AStar(mode='best', problem=JumpPointNavigationProblem(board)).solve()
+                astar = AStar(mode='best', problem=NavigationProblem(board)).solve()
+                self.assertLess(jps['expanded'], astar['expanded'])
+
+    def testRandomBoards(self):
+        rng = random.Random(3105)
+        for i in range(100):
+            path, length = random_board(rng, rng.randint(3, 20), rng.randint(3, 20), rng.randint(0, 10))
+            try:
+                with self.subTest(board=i):
+                    problem = JumpPointNavigationProblem(path)
+                    result = AStar(mode='best', problem=problem).solve()
+                    if length is None:
+                        self.assertEqual(result['path'], [])
+                    else:
+                        self.assertValidPath(problem, result['path'], length)
+            finally:
+                os.remove(path)
+
+
+class NavigationHeuristicTest(unittest.TestCase):
+
+    def testPrecomputedMatchesLazy(self):
+        for heuristic in ('manhattan', 'euclidean'):
+            with self.subTest(heuristic=heuristic):
+                lazy = NavigationProblem(BOARDS[-1], mode=heuristic)
+                table = NavigationProblem(BOARDS[-1], mode=heuristic)
+                table.precompute_heuristic()
+                for row, table_row in zip(lazy.grid, table.grid):
+                    for node, table_node in zip(row, table_row):
+                        self.assertAlmostEqual(lazy.heuristic(node), table.heuristic(table_node))
+
+    def testModeChangeClearsCache(self):
+        problem = NavigationProblem(BOARDS[0])
+        node = problem.get_node(0, 0)
+        goal = problem.get_goal_node()
+        self.assertEqual(problem.heuristic(node), abs(goal.x) + abs(goal.y))
+        problem.mode = 'euclidean'
+        self.assertAlmostEqual(problem.heuristic(node), (goal.x ** 2 + goal.y ** 2) ** 0.5)
+
+
+class BoardLoadingTest(unittest.TestCase):
+
+    def testRasterizedObstacles(self):
+        for board in BOARDS:
+            with self.subTest(board=os.path.basename(board)):
+                with open(board) as f:
+                    width, height = map(int, f.readline().split())
+                    f.readline()
+                    obstacles = [tuple(map(int, line.split())) for line in f if line.strip()]
+                blocked = {(ox + x, oy + y) for ox, oy, ow, oh in obstacles for x in range(ow) for y in range(oh)}
+                problem = NavigationProblem(board)
+                for y in range(height):
+                    for x in range(width):
+                        self.assertEqual(problem.is_walkable(x, y), (x, y) not in blocked)
+                        self.assertEqual(problem.get_node(x, y).walkable, (x, y) not in blocked)
+
+    def testObstaclesOutsideBoard(self):
+        for obstacle in ((2, 0, 3, 1), (0, 2, 1, 2), (-1, 3, 2, 1), (0, -1, 1, 1)):
+            with self.subTest(obstacle=obstacle):
+                path = write_board(4, 3, (0, 0), (3, 2), [obstacle])
+                try:
+                    with self.assertRaises(IndexError):
+                        read_text_board(path)
+                finally:
+                    os.remove(path)
+
+    def testNodesCreatedLazily(self):
+        problem = NavigationProblem(BOARDS[-1])
+        self.assertEqual(len(problem.grid.nodes), 2)
+        AStar(mode='best', problem=problem).solve()
+        self.assertLess(len(problem.grid.nodes), problem.grid.width * problem.grid.height)
+
+    def testChangedNodesOverrideCells(self):
+        problem = NavigationProblem(BOARDS[0])
+        problem.set_cell(0, 0, walkable=False)
+        self.assertFalse(problem.is_walkable(0, 0))
+        self.assertEqual(problem.grid.costs[0], 1)
+
+
+class LPAStarTest(unittest.TestCase):
+
+    def assertOptimal(self, problem, result):
+        expected = dijkstra(problem)
+        if expected is None:
+            self.assertEqual(result['path'], [])
+        else:
+            self.assertIs(result['path'][0], problem.get_goal_node())
+            self.assertIs(result['path'][-1], problem.get_start_node())
+            self.assertEqual(path_cost(problem, result['path']), expected)
+            self.assertTrue(all(node.walkable for node in result['path']))
+
+    def testShortestPaths(self):
+        for board in BOARDS:
+            with self.subTest(board=os.path.basename(board)):
+                result = LPAStar(problem=NavigationProblem(board)).solve()
+                self.assertEqual(len(result['path']) - 1, SHORTEST_PATHS[os.path.basename(board)])
+
+    def testReplanning(self):
+        rng = random.Random(4105)
+        for board in BOARDS:
+            problem = NavigationProblem(board)
+            planner = LPAStar(problem=problem)
+            planner.solve()
+            width, height = len(problem.grid[0]), len(problem.grid)
+            for i in range(20):
+                changed = []
+                for _ in range(rng.randint(1, 5)):
+                    x, y = rng.randrange(width), rng.randrange(height)
+                    if problem.get_node(x, y) in (problem.get_start_node(), problem.get_goal_node()):
+                        continue
+                    if rng.random() < 0.5:
+                        changed.append(problem.set_cell(x, y, walkable=not problem.get_node(x, y).walkable))
+                    else:
+                        changed.append(problem.set_cell(x, y, arc_cost=rng.randint(1, 5)))
+                with self.subTest(board=os.path.basename(board), replan=i):
+                    self.assertOptimal(problem, planner.replan(changed))
+
+    def testReplanningIsIncremental(self):
+        problem = NavigationProblem(BOARDS[-1])
+        planner = LPAStar(problem=problem)
+        initial = planner.solve()
+        node = initial['path'][len(initial['path']) // 2]
+        result = planner.replan([problem.set_cell(node.x, node.y, walkable=False)])
+        self.assertOptimal(problem, result)
+        self.assertLess(result['expanded'], initial['expanded'])
+
+
+class CompactNavigationProblemTest(unittest.TestCase):
+
+    def testMatchesNavigationProblem(self):
+        for board in BOARDS:
+            with self.subTest(board=os.path.basename(board)):
+                problem = NavigationProblem(board)
+                compact = CompactNavigationProblem(board)
+                for y in range(len(problem.grid)):
+                    for x in range(len(problem.grid[0])):
+                        self.assertEqual(problem.is_walkable(x, y), compact.is_walkable(x, y))
+                self.assertTrue(compact.get_start_node().is_start)
+                self.assertTrue(compact.get_goal_node().is_goal)
+
+    def testShortestPaths(self):
+        for board in BOARDS:
+            for mode in ASTAR_OPTIONS:
+                with self.subTest(board=os.path.basename(board), mode=mode):
+                    expected = AStar(mode=mode, problem=NavigationProblem(board)).solve()
+                    result = AStar(mode=mode, problem=CompactNavigationProblem(board)).solve()
+                    self.assertEqual([(n.x, n.y) for n in result['path']], [(n.x, n.y) for n in expected['path']])
+                    self.assertEqual(result['expanded'], expected['expanded'])
+
+    def testRows(self):
+        grid = CompactGrid(4, 3, walkable=bytearray(b'\x01\x01\x01\x01\x01\x00\x00\x00\x01\x00\x00\x00'))
+        self.assertEqual([[cell.walkable for cell in row] for row in grid], [
+            [True] * 4, [True, False, False, False], [True, False, False, False]
+        ])
+        self.assertEqual(len(grid[0]), 4)
+
+    def testCellsCreatedLazily(self):
+        problem = CompactNavigationProblem(BOARDS[-1])
+        AStar(mode='best', problem=problem).solve()
+        self.assertLess(len(problem.grid.cells), problem.grid.width * problem.grid.height)
+
+    def testJumpPointSearch(self):
+        class CompactJumpPointNavigationProblem(JumpPointNavigationProblem, CompactNavigationProblem):
+            pass
+
+        for board in BOARDS:
+            with self.subTest(board=os.path.basename(board)):
+                problem = CompactJumpPointNavigationProblem(board)
+                AStar(mode='best', problem=problem).solve()
+                self.assertEqual(problem.get_goal_node().g, SHORTEST_PATHS[os.path.basename(board)])
+
+
+class BinaryBoardTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def convert(self, board):
+        return convert_board(board, os.path.join(self.directory.name, os.path.basename(board) + '.navb'))
+
+    def testRoundTrip(self):
+        for board in BOARDS:
+            with self.subTest(board=os.path.basename(board)):
+                start, goal, cells = read_text_board(board)
+                binary_start, binary_goal, binary_cells = load_binary_board(self.convert(board))
+                self.assertEqual((start, goal), (binary_start, binary_goal))
+                self.assertEqual(cells.tolist(), binary_cells.tolist())
+
+    def testShortestPaths(self):
+        for board in BOARDS:
+            binary = self.convert(board)
+            for problem_class in (NavigationProblem, CompactNavigationProblem):
+                with self.subTest(board=os.path.basename(board), problem=problem_class.__name__):
+                    expected = AStar(mode='best', problem=problem_class(board)).solve()
+                    result = AStar(mode='best', problem=problem_class(binary)).solve()
+                    self.assertEqual([(n.x, n.y) for n in result['path']], [(n.x, n.y) for n in expected['path']])
+                    self.assertEqual(len(result['path']) - 1, SHORTEST_PATHS[os.path.basename(board)])
+
+    def testCompactGridUsesMappedCells(self):
+        problem = CompactNavigationProblem(self.convert(BOARDS[0]))
+        self.assertIsInstance(problem.grid.walkable, memoryview)
+        problem.set_cell(0, 0, walkable=False)
+        _, _, cells = load_binary_board(problem.board_path)
+        self.assertEqual(cells[0, 0], 1)
+
+    def testCellCosts(self):
+        binary = self.convert(BOARDS[0])
+        _, _, cells = load_binary_board(binary, mode='r+')
+        cells[0, 0] = 5
+        cells.flush()
+        del cells
+        self.assertEqual(NavigationProblem(binary).get_node(0, 0).arc_cost, 5)
+        problem = CompactNavigationProblem(binary)
+        self.assertEqual(problem.get_node(0, 0).arc_cost, 5)
+        self.assertEqual(problem.set_cell(0, 0, walkable=True).arc_cost, 5)
+        self.assertFalse(problem.set_cell(0, 0, walkable=False).walkable)
+        node = problem.set_cell(0, 0, walkable=True)
+        self.assertTrue(node.walkable)
+        self.assertEqual(node.arc_cost, 5)
+
+    def testRejectsOtherFiles(self):
+        with self.assertRaises(Exception):
+            load_binary_board(BOARDS[0])
+
+
+class PathServiceTest(unittest.TestCase):
+
+    def assertValidPath(self, service, result, start, goal):
+        path = result['path']
+        self.assertEqual((path[0], path[-1]), (start, goal))
+        for (ax, ay), (bx, by) in zip(path, path[1:]):
+            self.assertEqual(abs(ax - bx) + abs(ay - by), 1)
+            self.assertTrue(service.cells[ay, ax])
+        self.assertEqual(result['cost'], sum(int(service.cells[y, x]) for x, y in path[:-1]))
+
+    def testShortestPaths(self):
+        for board in BOARDS:
+            for mode in ('manhattan', 'euclidean'):
+                with self.subTest(board=os.path.basename(board), mode=mode):
+                    service = PathService.from_file(board, mode=mode)
+                    result = service.query(service.start, service.goal)
+                    self.assertEqual(result['cost'], SHORTEST_PATHS[os.path.basename(board)])
+                    self.assertValidPath(service, result, service.start, service.goal)
+
+    def testRandomBoards(self):
+        rng = random.Random(3105)
+        for i in range(100):
+            path, length = random_board(rng, rng.randint(3, 20), rng.randint(3, 20), rng.randint(0, 10))
+            try:
+                with self.subTest(board=i):
+                    service = PathService.from_file(path)
+                    result = service.query(service.start, service.goal)
+                    self.assertEqual(result['cost'], length)
+                    if length is None:
+                        self.assertEqual(result['path'], [])
+            finally:
+                os.remove(path)
+
+    def testCellCosts(self):
+        with tempfile.TemporaryDirectory() as directory:
+            binary = convert_board(BOARDS[-1], os.path.join(directory, 'board.navb'))
+            _, _, cells = load_binary_board(binary, mode='r+')
+            cells[::3, ::2] = 7
+            cells.flush()
+            del cells
+            problem = NavigationProblem(binary)
+            service = PathService.from_file(binary)
+            result = service.query(service.start, service.goal)
+            self.assertEqual(result['cost'], dijkstra(problem))
+            self.assertValidPath(service, result, service.start, service.goal)
+
+    def testQueriesLeaveGridUnchanged(self):
+        start, goal, cells = read_text_board(BOARDS[-1])
+        original = cells.copy()
+        service = PathService(cells)
+        free = list(zip(*np.nonzero(cells)))
+        rng = random.Random(3105)
+        queries = [((int(ax), int(ay)), (int(bx), int(by))) for (ay, ax), (by, bx) in
+                   (rng.sample(free, 2) for _ in range(20))]
+        first = service.query_all(queries)
+        self.assertEqual(service.query_all(queries), first)
+        self.assertTrue((cells == original).all())
+        with self.assertRaises(ValueError):
+            service.cells[0, 0] = 0
+
+    def testCoordinatesOutsideBoard(self):
+        service = PathService.from_file(BOARDS[-1])
+        for cell in ((service.width, 0), (-1, 0), (0, service.height), (0, -1)):
+            with self.subTest(cell=cell):
+                with self.assertRaises(ValueError):
+                    service.query(cell, service.goal)
+                with self.assertRaises(ValueError):
+                    service.query(service.start, cell)
+
+    def testBatchInWorkers(self):
+        service = PathService.from_file(BOARDS[-1])
+        free = [(x, y) for x in range(service.width) for y in range(service.height) if service.cells[y, x]]
+        rng = random.Random(3105)
+        queries = [tuple(rng.sample(free, 2)) for _ in range(30)]
+        self.assertEqual(service.query_all(queries, processes=2), service.query_all(queries))
+
+    def testBatchWithoutFork(self):
+        service = PathService(read_text_board(BOARDS[-1])[2])
+        self.assertIsNone(service.start)
+        self.assertIsNone(service.goal)
+        free = [(x, y) for x in range(service.width) for y in range(service.height) if service.cells[y, x]]
+        rng = random.Random(3105)
+        queries = [tuple(rng.sample(free, 2)) for _ in range(10)]
+        with mock.patch.object(GACPool, 'supported', return_value=False):
+            self.assertEqual(service.query_all(queries, processes=2), service.query_all(queries))
+
+
+class LandmarkHeuristicTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def copy(self, board):
+        return shutil.copy(board, self.directory)
+
+    def costly_board(self, board):
+        binary = convert_board(board, os.path.join(self.directory, os.path.basename(board) + '.navb'))
+        _, _, cells = load_binary_board(binary, mode='r+')
+        cells[::3, ::2] *= 7
+        cells.flush()
+        return binary
+
+    def testBoundIsAdmissible(self):
+        for board in BOARDS:
+            for path in (self.copy(board), self.costly_board(board)):
+                with self.subTest(board=os.path.basename(path)):
+                    _, (gx, gy), cells = load_binary_board(path) if path.endswith('.navb') else read_text_board(path)
+                    goal = gy * cells.shape[1] + gx
+                    landmarks = load_landmarks(path, cells)
+                    exact = cell_distances(cells, goal, reverse=True)
+                    bounds = landmark_bound(landmarks, slice(None), goal)
+                    reachable = np.isfinite(exact)
+                    self.assertTrue((bounds[reachable] <= exact[reachable] + 1e-9).all())
+                    self.assertEqual(bounds[goal], 0)
+                    estimate = landmark_estimator(landmarks, goal)
+                    for index in np.flatnonzero(reachable):
+                        self.assertEqual(estimate(index), bounds[index])
+                    for landmark in landmarks[0]:
+                        self.assertEqual(landmark_bound(landmarks, landmark, goal), exact[landmark])
+
+    def testShortestPaths(self):
+        for board in BOARDS:
+            with self.subTest(board=os.path.basename(board)):
+                path = self.copy(board)
+                problem = NavigationProblem(path, mode='landmarks')
+                result = AStar(mode='best', problem=problem).solve()
+                manhattan = AStar(mode='best', problem=NavigationProblem(path)).solve()
+                self.assertEqual(problem.get_goal_node().g, SHORTEST_PATHS[os.path.basename(board)])
+                self.assertLessEqual(result['expanded'], manhattan['expanded'])
+
+    def testCellCosts(self):
+        path = self.costly_board(BOARDS[-1])
+        problem = NavigationProblem(path, mode='landmarks')
+        AStar(mode='best', problem=problem).solve()
+        self.assertEqual(problem.get_goal_node().g, dijkstra(NavigationProblem(path)))
+
+    def testBidirectionalSearch(self):
+        for board in BOARDS:
+            with self.subTest(board=os.path.basename(board)):
+                problem = NavigationProblem(self.copy(board), mode='landmarks')
+                result = BidirectionalAStar(problem=problem).solve()
+                self.assertEqual(len(result['path']) - 1, SHORTEST_PATHS[os.path.basename(board)])
+                self.assertEqual(set(problem.landmark_estimators),
+                                 {(problem.get_start_node().index, True), (problem.get_goal_node().index, False)})
+                problem.reset_heuristic()
+                self.assertEqual(problem.landmark_estimators, {})
+
+    def testBidirectionalSearchWithCellCosts(self):
+        rng = random.Random(3105)
+        for i in range(60):
+            with self.subTest(board=i):
+                board, distance = random_board(rng, 12, 12, 4)
+                self.addCleanup(os.remove, board)
+                path = convert_board(board, os.path.join(self.directory, '%d.navb' % i))
+                _, _, cells = load_binary_board(path, mode='r+')
+                costly = np.array([rng.random() < 0.3 for _ in range(cells.size)]).reshape(cells.shape)
+                cells[costly & (cells > 0)] = 9
+                cells.flush()
+                problem = NavigationProblem(path, mode='landmarks')
+                start = problem.get_start_node()
+                exact = cell_distances(cells, start.index)
+                for row in problem.grid:
+                    for node in row:
+                        if np.isfinite(exact[node.index]):
+                            self.assertLessEqual(problem.reverse_heuristic(node), exact[node.index] + 1e-9)
+                result = BidirectionalAStar(problem=problem).solve()
+                if distance is not None:
+                    self.assertEqual(path_cost(problem, result['path']), dijkstra(NavigationProblem(path)))
+
+    def testPrecomputedMatchesLazy(self):
+        path = self.copy(BOARDS[-1])
+        lazy = NavigationProblem(path, mode='landmarks')
+        table = NavigationProblem(path, mode='landmarks')
+        table.precompute_heuristic()
+        for row, table_row in zip(lazy.grid, table.grid):
+            for node, table_node in zip(row, table_row):
+                self.assertAlmostEqual(lazy.heuristic(node), table.heuristic(table_node))
+
+    def testPersistedNextToBoard(self):
+        path = self.copy(BOARDS[-1])
+        _, _, cells = read_text_board(path)
+        landmarks = load_landmarks(path, cells)
+        saved = os.path.join(self.directory, LANDMARK_DIR, os.path.basename(path) + '.npz')
+        self.assertTrue(os.path.exists(saved))
+        modified = os.path.getmtime(saved)
+        reloaded = load_landmarks(path, cells)
+        self.assertEqual(os.path.getmtime(saved), modified)
+        for array, reloaded_array in zip(landmarks, reloaded):
+            self.assertTrue((array == reloaded_array).all())
+        self.assertEqual(len(load_landmarks(path, cells, count=2)[0]), 2)
+
+    def testSavedAtomically(self):
+        path = self.copy(BOARDS[-1])
+        load_landmarks(path, read_text_board(path)[2])
+        self.assertEqual(os.listdir(os.path.join(self.directory, LANDMARK_DIR)), [os.path.basename(path) + '.npz'])
+
+    def testUnwritableBoardDirectory(self):
+        path = self.copy(BOARDS[-1])
+        # A file in place of the landmark directory makes creating it fail, like a read only board directory
+        open(os.path.join(self.directory, LANDMARK_DIR), 'w').close()
+        problem = NavigationProblem(path, mode='landmarks')
+        AStar(mode='best', problem=problem).solve()
+        self.assertEqual(problem.get_goal_node().g, SHORTEST_PATHS[os.path.basename(path)])
+        for array, expected_array in zip(problem.get_landmarks(), compute_landmarks(read_text_board(path)[2])):
+            self.assertTrue((array == expected_array).all())
+
+    def testComputedFromUneditedBoard(self):
+        for problem_class in (NavigationProblem, CompactNavigationProblem):
+            with self.subTest(problem=problem_class.__name__):
+                path = self.copy(BOARDS[-1])
+                problem = problem_class(path, mode='landmarks')
+                problem.set_cell(1, 1, walkable=False)
+                landmarks = problem.get_landmarks()
+                expected = compute_landmarks(read_text_board(path)[2])
+                for array, expected_array in zip(landmarks, expected):
+                    self.assertTrue((array == expected_array).all())
+                shutil.rmtree(os.path.join(self.directory, LANDMARK_DIR))
+
+    def testPathService(self):
+        path = self.costly_board(BOARDS[-1])
+        service = PathService.from_file(path)
+        landmark_service = PathService.from_file(path, mode='landmarks')
+        free = [(x, y) for x in range(service.width) for y in range(service.height) if service.cells[y, x]]
+        rng = random.Random(3105)
+        queries = [tuple(rng.sample(free, 2)) for _ in range(30)]
+        results = service.query_all(queries)
+        landmark_results = landmark_service.query_all(queries)
+        self.assertEqual([r['cost'] for r in landmark_results], [r['cost'] for r in results])
+        self.assertLessEqual(sum(r['expanded'] for r in landmark_results), sum(r['expanded'] for r in results))
+
+
+class CSPStateTest(unittest.TestCase):
+
+    def testForkRecordsOnlyChanges(self):
+        root = CSPState({'a': {1, 2, 3}, 'b': {1, 2, 3}, 'c': {1, 2, 3}})
+        left = root.fork()
+        left.set_domain('a', {1})
+        right = root.fork()
+        right.set_domain('b', {2})
+        right.set_domain('c', {3})
+        grandchild = left.fork()
+        grandchild.set_domain('b', {1, 2})
+
+        self.assertEqual(len(left.changes), 1)
+        self.assertEqual(len(right.changes), 2)
+        self.assertEqual(left.nodes, {'a': {1}, 'b': {1, 2, 3}, 'c': {1, 2, 3}})
+        self.assertEqual(right.nodes, {'a': {1, 2, 3}, 'b': {2}, 'c': {3}})
+        self.assertEqual(grandchild.nodes, {'a': {1}, 'b': {1, 2}, 'c': {1, 2, 3}})
+        self.assertEqual(root.nodes, {'a': {1, 2, 3}, 'b': {1, 2, 3}, 'c': {1, 2, 3}})
+        self.assertEqual(right.nodes['c'], {3})
+
+    def testBitsetBackend(self):
+        root = CSPState({'a': {1, 2, 3}, 'b': {1, 2, 3}}, backend='bitset')
+        child = root.fork()
+        child.assign('a', 2)
+        self.assertIsInstance(child.nodes['a'], BitDomain)
+        self.assertEqual(child.nodes['a'], {2})
+        self.assertEqual(len(child.nodes['b']), 3)
+        self.assertIn(3, child.nodes['b'])
+        self.assertNotIn(2, child.nodes['a'].derive(0))
+        self.assertEqual(root.nodes['a'], {1, 2, 3})
+        self.assertNotEqual(root.nodes['a'], 3)
+        self.assertNotEqual(root.nodes['a'], None)
+        self.assertFalse(root.nodes['a'] == 3)
+
+    def testHashIgnoresReductionOrder(self):
+        for backend in ('set', 'bitset'):
+            with self.subTest(backend=backend):
+                root = CSPState({'a': {1, 2, 3}, 'b': {1, 2, 3}}, backend=backend)
+                left = root.fork()
+                left.assign('a', 1)
+                left = left.fork()
+                left.assign('b', 2)
+                right = root.fork()
+                right.assign('b', 2)
+                right = right.fork()
+                right.assign('a', 1)
+                fresh = CSPState({'a': {1}, 'b': {2}}, backend=backend)
+
+                self.assertEqual(left.hash, right.hash)
+                self.assertEqual(left.hash, fresh.hash)
+                self.assertNotEqual(left.hash, root.hash)
+                self.assertEqual(CSPNode(left), CSPNode(right))
+                self.assertEqual(len({CSPNode(left), CSPNode(right), CSPNode(root)}), 2)
+
+                left.rollback()
+                self.assertEqual(left.hash, left.parent.hash)
+
+    def testDomainCodec(self):
+        for backend in ('set', 'bitset'):
+            with self.subTest(backend=backend):
+                root = CSPState({'a': {1, 2, 3}, 'b': [(0, 1), (1, 0)]}, backend=backend)
+                codec = DomainCodec(root.nodes)
+                child = root.fork()
+                child.set_domain('a', root.nodes['a'].derive(0b101) if backend == 'bitset' else {1, 3})
+                masks = codec.encode_all(child.nodes)
+                self.assertEqual(masks['b'], 0b11)
+                self.assertEqual(bin(masks['a']).count('1'), 2)
+                self.assertEqual(codec.decode_all(masks), child.nodes)
+
+    def testRollback(self):
+        root = CSPState({'a': {1, 2}, 'b': {1, 2}})
+        child = root.fork()
+        child.set_domain('a', {2})
+        child.rollback()
+        self.assertEqual(child.changes, [])
+        self.assertEqual(root.nodes, {'a': {1, 2}, 'b': {1, 2}})
+
+    def testRollbackRefusedAfterFork(self):
+        root = CSPState({'a': {1, 2}, 'b': {1, 2}})
+        child = root.fork()
+        child.set_domain('a', {2})
+        grandchild = child.fork()
+        grandchild.set_domain('b', {1})
+        with self.assertRaises(Exception):
+            child.rollback()
+        with self.assertRaises(Exception):
+            root.rollback()
+        self.assertEqual(grandchild.nodes, {'a': {2}, 'b': {1}})
+        self.assertEqual(child.nodes, {'a': {2}, 'b': {1, 2}})
+
+
+class GACTest(unittest.TestCase):
+
+    def assertColoring(self, state, edges):
+        for node, domain in state.nodes.items():
+            self.assertEqual(len(domain), 1)
+        for a, b in edges:
+            self.assertNotEqual(state.nodes[a], state.nodes[b])
+
+    def testQueueHoldsArcsOnce(self):
+        nodes, edges = Graph.read_graph_from_file(os.path.join(GRAPHS_DIR, 'graph01.txt'), lightweight=True)
+        cnet = {n: [] for n in nodes}
+        for a, b in edges:
+            cnet[a].append(b)
+            cnet[b].append(a)
+        gac = GAC(cnet=cnet, csp_state=CSPState({n: set(range(4)) for n in nodes}))
+        gac.initialize()
+        gac.initialize()
+        self.assertEqual(len(gac.queue), len(set(gac.queue)))
+        self.assertEqual(len(gac.queue), 2 * len(edges))
+
+    def testVertexColoring(self):
+        for graph in ('graph01.txt', 'graph02.txt', 'graph03.txt'):
+            with self.subTest(graph=graph):
+                nodes, edges = Graph.read_graph_from_file(os.path.join(GRAPHS_DIR, graph), lightweight=True)
+                problem = VCProblem({n: set(range(4)) for n in nodes}, edges)
+                result = AStar(problem=problem).solve()
+                self.assertTrue(result['path'])
+                self.assertColoring(result['path'][0].state, edges)
+                self.assertGreater(problem.gac.revisions, 0)
+                self.assertGreater(problem.gac.removals, 0)
+
+    def testBitsetVertexColoring(self):
+        for graph in ('graph01.txt', 'graph02.txt', 'graph03.txt', 'graph04.txt'):
+            with self.subTest(graph=graph):
+                nodes, edges = Graph.read_graph_from_file(os.path.join(GRAPHS_DIR, graph), lightweight=True)
+                sets = VCProblem({n: set(range(4)) for n in nodes}, edges)
+                bits = VCProblem({n: set(range(4)) for n in nodes}, edges, backend='bitset')
+                self.assertEqual(sets.gac.csp_state.nodes, bits.gac.csp_state.nodes)
+                expected = AStar(problem=sets).solve()
+                result = AStar(problem=bits).solve()
+                self.assertColoring(result['path'][0].state, edges)
+                self.assertEqual(len(expected['path']), len(result['path']))
+                self.assertEqual(sets.gac.removals, bits.gac.removals)
+
+    def testCompiledConstraintTables(self):
+        calls = []
+
+        def cf(x, y):
+            calls.append((x, y))
+            return x != y
+
+        nodes, edges = Graph.read_graph_from_file(os.path.join(GRAPHS_DIR, 'graph03.txt'), lightweight=True)
+        problem = VCProblem({n: set(range(4)) for n in nodes}, edges, cf=cf)
+        self.assertEqual(len(problem.gac.tables), 2 * len(edges))
+        result = AStar(problem=problem).solve()
+        self.assertColoring(result['path'][0].state, edges)
+        self.assertEqual(len(calls), 4 * 4)
+
+    def testOrderings(self):
+        for graph in ('graph01.txt', 'graph03.txt'):
+            nodes, edges = Graph.read_graph_from_file(os.path.join(GRAPHS_DIR, graph), lightweight=True)
+            for variable_order in VARIABLE_ORDERS:
+                for value_order in VALUE_ORDERS:
+                    with self.subTest(graph=graph, variable_order=variable_order, value_order=value_order):
+                        problem = VCProblem({n: set(range(4)) for n in nodes}, edges,
+                                            variable_order=variable_order, value_order=value_order)
+                        result = AStar(problem=problem).solve()
+                        self.assertColoring(result['path'][0].state, edges)
+                        self.assertGreater(problem.branches, 0)
+
+    def testMinimumRemainingValuesExhaustsUncolorableGraph(self):
+        nodes, edges = Graph.read_graph_from_file(os.path.join(GRAPHS_DIR, 'graph05.txt'), lightweight=True)
+        problem = VCProblem({n: set(range(4)) for n in nodes}, edges, variable_order='mrv')
+        result = AStar(problem=problem).solve()
+        self.assertEqual(result['path'], [])
+        self.assertGreater(problem.failures, 0)
+
+    def testVariableSelection(self):
+        edges = [(0, 1), (0, 2), (0, 3), (1, 2)]
+        problem = VCProblem({0: {0, 1, 2}, 1: {0, 1, 2}, 2: {0, 1}, 3: {0, 1, 2}}, edges)
+        domains = problem.gac.csp_state.nodes
+        self.assertEqual(problem.select_first(domains), 0)
+        self.assertEqual(problem.select_mrv(domains), 2)
+        self.assertEqual(problem.select_degree(domains), 0)
+        problem.gac.weights[(1, 2)] = problem.gac.weights[(2, 1)] = 5
+        self.assertEqual(problem.select_domwdeg(domains), 2)
+        problem.gac.weights[(0, 3)] = problem.gac.weights[(3, 0)] = 10
+        self.assertEqual(problem.select_domwdeg(domains), 0)
+
+    def testLeastConstrainingValue(self):
+        problem = VCProblem({0: {0, 1, 2}, 1: {1, 2}, 2: {2, 3}}, [(0, 1), (0, 2)])
+        self.assertEqual(problem.order_lcv(0, problem.gac.csp_state.nodes), [0, 1, 2])
+
+    def testWipeoutIncreasesConstraintWeight(self):
+        gac = GAC(cnet={0: [1], 1: [0]}, csp_state=CSPState({0: {1}, 1: {1}}))
+        self.assertTrue(gac.revise(0, 1))
+        self.assertTrue(gac.csp_state.contradiction)
+        self.assertEqual(gac.weights[(0, 1)], 2)
+        self.assertEqual(gac.weights[(1, 0)], 2)
+
+    def testDuplicateStatesExpandedOnce(self):
+        class AllVariablesProblem(VCProblem):
+            """
+            Branches on every unassigned node instead of one, so states are reached in several orders
+            """
+            def get_all_successor_nodes(self, astar_state):
+                successors = []
+                for node in [n for n, domain in astar_state.state.nodes.items() if len(domain) > 1]:
+                    self.select_variable = lambda domains, node=node: node
+                    successors.extend(VCProblem.get_all_successor_nodes(self, astar_state))
+                return successors
+
+        nodes = {n: set(range(3)) for n in range(4)}
+        edges = [(0, 1), (2, 3)]
+        expanded = {}
+        for node_class in (AStarState, CSPNode):
+            problem = type('Problem', (AllVariablesProblem,), {'node_class': node_class})(nodes, edges)
+            solver = AStar(mode='bfs', problem=problem)
+            for step in solver.agenda_loop():
+                pass
+            expanded[node_class] = solver.expanded
+        # Each edge is in one of 1 + 3 + 3 + 6 distinct states
+        self.assertLessEqual(expanded[CSPNode], 13 ** 2)
+        self.assertLess(expanded[CSPNode], expanded[AStarState])
+
+    def testProcessPoolBranching(self):
+        nodes, edges = Graph.read_graph_from_file(os.path.join(GRAPHS_DIR, 'graph03.txt'), lightweight=True)
+        for backend in ('set', 'bitset'):
+            with self.subTest(backend=backend):
+                serial = VCProblem({n: set(range(4)) for n in nodes}, edges, backend=backend)
+                with VCProblem({n: set(range(4)) for n in nodes}, edges, backend=backend, processes=2) as parallel:
+                    expected = AStar(problem=serial).solve()
+                    result = AStar(problem=parallel).solve()
+                self.assertIs(parallel.brancher, parallel.gac)
+                self.assertColoring(result['path'][0].state, edges)
+                self.assertEqual(expected['expanded'], result['expanded'])
+                self.assertEqual(serial.gac.revisions, parallel.gac.revisions)
+                self.assertEqual(serial.gac.removals, parallel.gac.removals)
+
+    def testNestedPropagation(self):
+        # A constraint function starting a propagation of its own must not disturb the running one
+        domains = {0: {0, 1}, 1: {0, 1}, 2: {0, 1}}
+        gac = GAC(cnet={0: [1, 2], 1: [0], 2: [0]}, csp_state=CSPState(domains))
+        inner = CSPState(domains).fork()
+        inner.assign(0, 1)
+        calls = []
+
+        def cf(x, y):
+            if not calls:
+                calls.append(True)
+                gac.propagate(inner, 0)
+            return x != y
+
+        gac.cf = cf
+        outer = CSPState(domains).fork()
+        outer.assign(0, 0)
+        gac.propagate(outer, 0)
+        self.assertEqual(outer.nodes, {0: {0}, 1: {1}, 2: {1}})
+        self.assertEqual(inner.nodes, {0: {1}, 1: {0}, 2: {0}})
+        self.assertFalse(gac.queue)
+
+    def testResiduesSurviveSearchStates(self):
+        gac = GAC(cnet={0: [1], 1: [0]}, csp_state=CSPState({0: {0, 1}, 1: {0, 1}}))
+        self.assertFalse(gac.revise(0, 1))
+        gac.csp_state = CSPState({0: {0, 1}, 1: {1}})
+        self.assertTrue(gac.revise(0, 1))
+        self.assertEqual(gac.csp_state.nodes[0], {0})
+        self.assertEqual(gac.removals, 1)
+
+
+class NonogramProblemTest(unittest.TestCase):
+
+    def assertSolved(self, problem, state):
+        for row in range(problem.total_rows):
+            self.assertEqual(len(state.nodes[row]), 1)
+            for col in range(problem.total_cols):
+                self.assertEqual(len(state.nodes[problem.total_rows + col]), 1)
+                row_pattern = state.nodes[row][0][1]
+                col_pattern = state.nodes[problem.total_rows + col][0][1]
+                self.assertEqual(row_pattern >> col & 1, col_pattern >> row & 1)
+
+    def testSolvedByFiltering(self):
+        for nonogram in ('0-heart.txt', '1-cat.txt', '2-chick.txt', '7-example.txt'):
+            with self.subTest(nonogram=nonogram):
+                problem = NonogramProblem(os.path.join(NONOGRAMS_DIR, nonogram))
+                result = AStar(problem=problem).solve()
+                self.assertTrue(result['path'])
+                self.assertSolved(problem, result['path'][0].state)
+
+    def testPatterns(self):
+        self.assertEqual(NonogramProblem.gen_patterns([2, 1], 5), [0b01011, 0b10011, 0b10110])
+        self.assertEqual(NonogramProblem.gen_patterns([], 3), [0])
+        self.assertEqual(NonogramProblem.gen_patterns([3], 3), [0b111])
+        self.assertEqual(len(NonogramProblem.gen_patterns([1, 1, 1], 10)), 56)
+
+    def testLazyPatternsAgreeWithFixedCells(self):
+        rng = random.Random(20)
+        for _ in range(50):
+            cols = rng.randint(1, 12)
+            counts = [rng.randint(1, 3) for _ in range(rng.randint(0, 3))]
+            filled, blank = rng.getrandbits(cols) & rng.getrandbits(cols), rng.getrandbits(cols) & rng.getrandbits(cols)
+            blank &= ~filled
+            with self.subTest(counts=counts, cols=cols, filled=filled, blank=blank):
+                expected = [p for p in NonogramProblem.gen_patterns(counts, cols)
+                            if p & filled == filled and not p & blank]
+                self.assertEqual(list(NonogramProblem.iter_patterns(counts, cols, filled, blank)), expected)
+                self.assertEqual(NonogramProblem.count_patterns(counts, cols, filled, blank), len(expected))
+
+                solved = NonogramProblem.line_solve(counts, cols, filled, blank)
+                if not expected:
+                    self.assertIsNone(solved)
+                    continue
+                every, some = -1, 0
+                for p in expected:
+                    every &= p
+                    some |= p
+                self.assertEqual(solved, (every & ((1 << cols) - 1), ((1 << cols) - 1) & ~some))
+
+    def testLineSolve(self):
+        self.assertEqual(NonogramProblem.line_solve([8], 10), (0b0011111100, 0))
+        self.assertEqual(NonogramProblem.line_solve([3, 1], 5), (0b10111, 0b01000))
+        self.assertEqual(NonogramProblem.line_solve([2], 5, filled=0b00001), (0b00011, 0b11100))
+        # Only 0b00101 and 0b10100 remain, both leaving cells 1 and 3 blank
+        self.assertEqual(NonogramProblem.line_solve([1, 1], 5, filled=0b00100), (0b00100, 0b01010))
+        self.assertIsNone(NonogramProblem.line_solve([3], 2))
+
+    def testLargeNonograms(self):
+        for nonogram in ('nono-possible-2.txt', 'nono-really-hard.txt'):
+            with self.subTest(nonogram=nonogram):
+                problem = NonogramProblem(os.path.join(NONOGRAMS_DIR, nonogram))
+                result = AStar(problem=problem).solve()
+                self.assertSolved(problem, result['path'][0].state)
+
+    def testLineRevisionMatchesGenericRevision(self):
+        for nonogram in ('1-cat.txt', '7-example.txt'):
+            with self.subTest(nonogram=nonogram):
+                path = os.path.join(NONOGRAMS_DIR, nonogram)
+                generic = type('Problem', (NonogramProblem,), {'gac_class': GAC})(path)
+                line = NonogramProblem(path)
+                self.assertEqual(generic.gac.csp_state.nodes, line.gac.csp_state.nodes)
+                self.assertEqual(generic.gac.removals, line.gac.removals)
+
+    def testUnsolvable(self):
+        # Rows top to bottom, then columns, in the nonogram file format
+        puzzles = {
+            'empty column domains': '2 3\n1\n0\n1\n3\n3\n',
+            'contradiction by filtering': '3 3\n1 1\n1\n1 1\n1\n3\n1\n',
+            'line too short': '2 1\n3\n1\n1\n',
+        }
+        for name, puzzle in puzzles.items():
+            fd, path = tempfile.mkstemp(suffix='.txt')
+            with os.fdopen(fd, 'w') as f:
+                f.write(puzzle)
+            try:
+                with self.subTest(puzzle=name):
+                    result = AStar(problem=NonogramProblem(path)).solve()
+                    self.assertEqual(result['path'], [])
+            finally:
+                os.remove(path)
+
+    def testLazyLines(self):
+        rng = random.Random(3105)
+        lazy = 0
+        for i in range(10):
+            path = random_nonogram(rng, 10, 10, 0.4)
+            self.addCleanup(os.remove, path)
+            expected = AStar(problem=NonogramProblem(path)).solve()
+            for pattern_limit in (1, 4):
+                with self.subTest(nonogram=i, pattern_limit=pattern_limit):
+                    problem = NonogramProblem(path, pattern_limit=pattern_limit)
+                    lazy += sum(isinstance(domain, LineDomain) for domain in problem.nodes.values())
+                    result = AStar(problem=problem).solve()
+                    self.assertSolved(problem, result['path'][0].state)
+                    self.assertEqual(result['path'][0].state.nodes, expected['path'][0].state.nodes)
+        self.assertGreater(lazy, 0)
+
+        path = random_nonogram(rng, 10, 10, 0.4)
+        self.addCleanup(os.remove, path)
+        serial = AStar(problem=NonogramProblem(path, pattern_limit=1)).solve()
+        with NonogramProblem(path, processes=2, pattern_limit=1) as parallel:
+            result = AStar(problem=parallel).solve()
+        self.assertEqual(serial['expanded'], result['expanded'])
+        self.assertSolved(parallel, result['path'][0].state)
+
+    def testLineDomain(self):
+        path = random_nonogram(random.Random(3105), 10, 10, 0.3)
+        self.addCleanup(os.remove, path)
+        problem = NonogramProblem(path, pattern_limit=1)
+        for node, domain in problem.nodes.items():
+            if not isinstance(domain, LineDomain):
+                continue
+            with self.subTest(node=node):
+                expected = [(problem.line_index(node), pattern) for pattern in NonogramProblem.gen_patterns(
+                    problem.clues[node], problem.line_length(node)
+                ) if pattern & domain.filled == domain.filled and not pattern & domain.blank]
+                self.assertEqual(list(domain), expected)
+                self.assertEqual(len(domain), len(expected))
+                cell = ~(domain.filled | domain.blank) & -~(domain.filled | domain.blank)
+                filled, blank = domain.restrict(filled=cell), domain.restrict(blank=cell)
+                self.assertEqual(sorted(list(filled) + list(blank)), sorted(expected))
+                self.assertEqual(domain.restrict(), domain)
+
+    def testLargePuzzleMemory(self):
+        # Enumerating every pattern left after inference would take hundreds of millions of values
+        path = random_nonogram(random.Random(1), 40, 40, 0.2)
+        self.addCleanup(os.remove, path)
+        tracemalloc.start()
+        try:
+            problem = NonogramProblem(path)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(sum(NonogramProblem.count_patterns(counts, problem.line_length(node),
+                                                              problem.filled[node], problem.blank[node])
+                               for node, counts in problem.clues.items()), 10 ** 8)
+        self.assertLess(peak, 16 * 2 ** 20)
+
+    def testProcessPoolBranching(self):
+        # Two diagonal solutions, so filtering alone cannot solve it
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w') as f:
+            f.write('2 2\n1\n1\n1\n1\n')
+        try:
+            serial = NonogramProblem(path)
+            with NonogramProblem(path, processes=2) as parallel:
+                expected = AStar(problem=serial).solve()
+                result = AStar(problem=parallel).solve()
+        finally:
+            os.remove(path)
+        self.assertGreater(expected['expanded'], 1)
+        self.assertEqual(expected['expanded'], result['expanded'])
+        self.assertSolved(parallel, result['path'][0].state)
+
+
+if __name__ == '__main__':
+    unittest.main()